@@ -0,0 +1,318 @@
+import os
+import sys
+import gzip
+import time
+import zlib
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+# local stand-in for kolesa.kz, used by benchmark.py to measure the scripts without touching the live site
+#   listing pages:  /<shard>/[?page=N]   20 cards (a.a-card__link inside div.a-list), a.next_page until the last page
+#   ad pages:       /a/show/<id>         div.offer__price and the div.offer__parameters dl blocks of the real page
+# every page is generated from its id, so a given corpus always serves the same content
+# latency and failures (503, 429, captcha pages) can be injected with fixed rates
+
+BRANDS = {
+    'Toyota': ['Camry', 'Corolla', 'Land Cruiser Prado', 'RAV4'],
+    'Hyundai': ['Accent', 'Elantra', 'Tucson', 'Sonata'],
+    'Kia': ['Rio', 'K5', 'Sportage'],
+    'Lexus': ['RX 350', 'LX 570'],
+    'Chevrolet': ['Cobalt', 'Nexia'],
+    'ВАЗ (Lada)': ['Granta', '2107'],
+    'Mercedes-Benz': ['E 200', 'S 500'],
+    'Volkswagen': ['Polo', 'Passat'],
+}
+CITIES = ['Алматы', 'Астана', 'Шымкент', 'Караганда']
+# values as the ad page writes them, listing cards write body style, transmission and drive in lowercase
+BODY_STYLES = ['Седан', 'Кроссовер', 'Хэтчбек', 'Внедорожник', 'Универсал']
+COLORS = ['белый', 'черный', 'серебристый', 'серый', 'синий', 'красный', 'белый металлик', 'серый металлик']
+TRANSMISSIONS = ['Автомат', 'Механика', 'Вариатор', 'Робот']
+DRIVE_TYPES = ['Передний привод', 'Полный привод', 'Задний привод']
+
+CARDS_PER_PAGE = 20
+PAGE_CACHE_SIZE = 512  # encoded pages kept by a StandInServer
+CAPTCHA_PAGE = '<html><body><div class="g-recaptcha" data-sitekey="bench"></div></body></html>'
+
+def _format_number(value):
+    return f"{value:,}".replace(',', ' ')
+
+class FixtureCorpus:
+    # deterministic listing and ad pages
+    # pages_per_shard: listing pages before a shard ends; ad_page_kb: approximate size of an ad page
+    # (real ad pages carry a lot of markup and inline scripts around the few fields that are parsed)
+    # page_dir: serve saved ad pages (*.html) from this directory instead of generated ones
+    def __init__(self, pages_per_shard=50, ad_page_kb=150, page_dir=None, seed=0):
+        self.pages_per_shard = pages_per_shard
+        self.ad_page_kb = ad_page_kb
+        self.seed = seed
+        self.saved_pages = []
+        if page_dir:
+            for name in sorted(os.listdir(page_dir)):
+                if name.endswith(('.html', '.htm')):
+                    with open(os.path.join(page_dir, name), encoding='utf-8', errors='replace') as f:
+                        self.saved_pages.append(f.read())
+
+    def ad(self, ad_id):
+        # field values of one ad, shared by its listing card and its detail page
+        rng = random.Random(self.seed * 1_000_003 + ad_id)
+        brand = rng.choice(sorted(BRANDS))
+        year = rng.randint(1995, 2025)
+        return {
+            'id': ad_id,
+            'brand': brand,
+            'model': rng.choice(BRANDS[brand]),
+            'year': year,
+            'price': rng.randrange(1_500_000, 60_000_000, 10_000),
+            'city': rng.choice(CITIES),
+            'mileage': rng.randrange(0, 15_000 * (2026 - year), 100) if rng.random() > 0.1 else None,
+            'engine_volume_liters': rng.choice([1.4, 1.6, 2.0, 2.5, 3.5, 4.6]),
+            'body_style': rng.choice(BODY_STYLES),
+            'color': rng.choice(COLORS) if rng.random() > 0.15 else None,
+            'transmission': rng.choice(TRANSMISSIONS),
+            'drive_type': rng.choice(DRIVE_TYPES),
+        }
+
+    def ad_ids(self, shard, page):
+        # newest first: ids fall from page to page, distinct for every shard
+        base = (zlib.crc32(shard.encode('utf-8')) % 1000) * 10_000_000
+        top = base + self.pages_per_shard * CARDS_PER_PAGE
+        first = top - (page - 1) * CARDS_PER_PAGE
+        return list(range(first, first - CARDS_PER_PAGE, -1))
+
+    def _card(self, ad):
+        description = (f"{ad['year']} г., Б/у {ad['body_style'].lower()}, {ad['engine_volume_liters']} л, бензин, "
+                       f"КПП {ad['transmission'].lower()}")
+        if ad['mileage'] is not None:
+            description += f", с пробегом {_format_number(ad['mileage'])} км"
+        if ad['color'] is not None:
+            description += f", {ad['color']}"
+        description += f", {ad['drive_type'].lower()}"
+        return (
+            '<div class="a-card js__a-card" data-id="{id}">'
+            '<div class="a-card__header"><h5 class="a-card__title">'
+            '<a class="a-card__link" href="/a/show/{id}?fromList=1">{brand} {model}</a></h5>'
+            '<span class="a-card__price">{price}&nbsp;₸</span></div>'
+            '<p class="a-card__description">{description}</p>'
+            '<div class="a-card__footer"><span class="a-card__param" data-test="region">{city}</span>'
+            '<span class="a-card__param a-card__param--date">сегодня</span></div></div>'
+        ).format(**dict(ad, description=description, price=_format_number(ad['price'])))
+
+    def listing_page(self, shard, page):
+        if page > self.pages_per_shard:
+            return '<html><body><div class="a-list"></div><p>Ничего не найдено</p></body></html>'
+        cards = ''.join(self._card(self.ad(ad_id)) for ad_id in self.ad_ids(shard, page))
+        next_link = f'<a class="next_page" href="/{shard}?page={page + 1}">Далее</a>' if page < self.pages_per_shard else ''
+        return (
+            '<!DOCTYPE html><html><head><meta charset="utf-8"><title>Продажа авто</title></head><body>'
+            f'<div class="a-list">{cards}</div><div class="pager">{next_link}</div></body></html>'
+        )
+
+    def ad_page(self, ad_id):
+        if self.saved_pages:
+            return self.saved_pages[ad_id % len(self.saved_pages)]
+        ad = self.ad(ad_id)
+        parameters = [
+            ('Город', ad['city']),
+            ('Кузов', ad['body_style']),
+            ('Объем двигателя, л', f"{ad['engine_volume_liters']} (бензин)"),
+            ('Пробег', f"{_format_number(ad['mileage'])} км" if ad['mileage'] is not None else None),
+            ('Коробка передач', ad['transmission']),
+            ('Цвет', ad['color']),
+            ('Привод', ad['drive_type']),
+        ]
+        blocks = ''.join(
+            f'<dl><dt class="value-title" title="{key}">{key}</dt><dd class="value">{value}</dd></dl>'
+            for key, value in parameters if value is not None
+        )
+        head = (
+            '<!DOCTYPE html><html lang="ru"><head><meta charset="utf-8">'
+            f'<title>{ad["brand"]} {ad["model"]} {ad["year"]} г. в {ad["city"]}</title>'
+        )
+        body = (
+            '<div class="offer"><h1 class="offer__title">'
+            f'<span itemprop="brand">{ad["brand"]} {ad["model"]}</span> <span itemprop="name">{ad["model"]}</span> '
+            f'<span class="year">{ad["year"]}</span></h1>'
+            f'<div class="offer__sidebar"><div class="offer__price">{_format_number(ad["price"])}&nbsp;₸</div>'
+            f'<div class="offer__location">{ad["city"]}</div></div>'
+            f'<div class="offer__parameters">{blocks}</div></div>'
+        )
+        return head + self._padding(ad_id, len(head) + len(body)) + '</head><body>' + body + '</body></html>'
+
+    def _padding(self, ad_id, used):
+        # inline script and style of roughly the size of a real page, never matched by the selectors
+        size = max(0, self.ad_page_kb * 1024 - used)
+        chunk = f'window.__bench = window.__bench || []; window.__bench.push({{"ad": {ad_id}, "slot": "%d"}});\n'
+        lines, total, n = [], 0, 0
+        while total < size:
+            line = chunk % n
+            lines.append(line)
+            total += len(line)
+            n += 1
+        return '<script>' + ''.join(lines) + '</script>'
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real site
+
+    def do_GET(self):
+        self.server.stand_in.handle(self)
+
+    def log_message(self, format, *args):
+        pass
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients hanging up mid-response (closed sessions, timeouts) are expected, anything else is printed
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+class StandInServer:
+    # threaded http server around a FixtureCorpus; start() returns the base url to use instead of https://kolesa.kz
+    # latency_ms + up to jitter_ms are added to every response, then a request fails with
+    # error_rate (503), throttle_rate (429) or captcha_rate (200 with a captcha page)
+    def __init__(self, corpus=None, host='127.0.0.1', port=0, latency_ms=0, jitter_ms=0,
+                 error_rate=0.0, throttle_rate=0.0, captcha_rate=0.0, seed=0):
+        self.corpus = corpus or FixtureCorpus(seed=seed)
+        self.host = host
+        self.port = port
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._pages = {}  # (kind, *key) -> encoded page, oldest first
+        self._server = None
+        self._thread = None
+        self.stats = {}
+        self.configure(latency_ms=latency_ms, jitter_ms=jitter_ms, error_rate=error_rate,
+                       throttle_rate=throttle_rate, captcha_rate=captcha_rate)
+
+    def configure(self, latency_ms=0, jitter_ms=0, error_rate=0.0, throttle_rate=0.0, captcha_rate=0.0):
+        # sets the injected latency and failure rates of a running server (anything not given is off), resets the stats
+        with self._lock:
+            self.latency_ms = latency_ms
+            self.jitter_ms = jitter_ms
+            self.error_rate = error_rate
+            self.throttle_rate = throttle_rate
+            self.captcha_rate = captcha_rate
+            self.stats = {'requests': 0, 'ok': 0, 'not_found': 0, 'error': 0, 'throttled': 0, 'captcha': 0}
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        self._server = _Server((self.host, self.port), _Handler)
+        self._server.stand_in = self
+        self.port = self._server.server_port
+        self._thread = threading.Thread(target=self._server.serve_forever, name='bench-server', daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def _outcome(self):
+        with self._lock:
+            self.stats['requests'] += 1
+            delay = (self.latency_ms + self._random.uniform(0, self.jitter_ms)) / 1000
+            roll = self._random.random()
+        if roll < self.error_rate:
+            return delay, 'error'
+        if roll < self.error_rate + self.throttle_rate:
+            return delay, 'throttled'
+        if roll < self.error_rate + self.throttle_rate + self.captcha_rate:
+            return delay, 'captcha'
+        return delay, 'ok'
+
+    def _count(self, outcome):
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def handle(self, request):
+        delay, outcome = self._outcome()
+        if delay:
+            time.sleep(delay)
+        if outcome == 'error':
+            return self._send(request, 503, 'Service Unavailable', outcome)
+        if outcome == 'throttled':
+            return self._send(request, 429, 'Too Many Requests', outcome)
+        if outcome == 'captcha':
+            return self._send(request, 200, CAPTCHA_PAGE, outcome)
+
+        parts = urlsplit(request.path)
+        path = parts.path
+        if path.startswith('/a/show/') and path[len('/a/show/'):].isdigit():
+            return self._send(request, 200, self._page('ad', int(path[len('/a/show/'):])), 'ok')
+        if path.endswith('/') and len(path) > 1:
+            page = int(parse_qs(parts.query).get('page', ['1'])[0])
+            return self._send(request, 200, self._page('listing', path.lstrip('/'), page), 'ok')
+        return self._send(request, 404, 'Not Found', 'not_found')
+
+    def _page(self, kind, *key):
+        # encoded page bytes, plain and gzip; the last PAGE_CACHE_SIZE pages are cached per server
+        cache_key = (kind,) + key
+        with self._lock:
+            page = self._pages.get(cache_key)
+        if page is None:
+            html = self.corpus.ad_page(*key) if kind == 'ad' else self.corpus.listing_page(*key)
+            body = html.encode('utf-8')
+            page = body, gzip.compress(body, compresslevel=5)
+            with self._lock:
+                if len(self._pages) >= PAGE_CACHE_SIZE:
+                    self._pages.pop(next(iter(self._pages)))
+                self._pages[cache_key] = page
+        return page
+
+    def _send(self, request, status, body, outcome):
+        self._count(outcome)
+        if isinstance(body, tuple):
+            plain, compressed = body
+            use_gzip = 'gzip' in request.headers.get('Accept-Encoding', '')
+            payload = compressed if use_gzip else plain
+        else:
+            use_gzip, payload = False, body.encode('utf-8')
+        request.send_response(status)
+        request.send_header('Content-Type', 'text/html; charset=utf-8')
+        request.send_header('Content-Length', str(len(payload)))
+        if use_gzip:
+            request.send_header('Content-Encoding', 'gzip')
+        request.end_headers()
+        request.wfile.write(payload)
+
+if __name__ == "__main__":
+    # serves the stand-in until ctrl+c, e.g. to point find_urls.BASE_URL or config['base_url'] at it
+    parser = argparse.ArgumentParser(description="local kolesa.kz stand-in with latency and error injection")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--pages', type=int, default=50, help="listing pages per shard")
+    parser.add_argument('--ad-kb', type=int, default=150, help="approximate size of a generated ad page")
+    parser.add_argument('--page-dir', default=None, help="serve saved ad pages from this directory")
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--captcha-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    corpus = FixtureCorpus(pages_per_shard=args.pages, ad_page_kb=args.ad_kb, page_dir=args.page_dir)
+    server = StandInServer(corpus, port=args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                           error_rate=args.error_rate, throttle_rate=args.throttle_rate, captcha_rate=args.captcha_rate)
+    print(f"serving the kolesa.kz stand-in at {server.start()} (listing: /cars/almaty/, ads: /a/show/<id>), ctrl+c to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"\nstopped, requests: {server.stats}")
+        server.stop()
@@ -0,0 +1,333 @@
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import threading
+import contextlib
+import http.client
+import multiprocessing
+from datetime import datetime
+from urllib.parse import urlsplit
+from concurrent.futures import ProcessPoolExecutor
+
+from bench_server import FixtureCorpus, StandInServer
+
+# offline throughput benchmarks of both scripts against the local kolesa.kz stand-in (bench_server.py)
+#   python scripts/benchmark.py                       runs everything and compares with benchmark_baseline.json
+#   python scripts/benchmark.py parse save_csv        runs only these benchmarks
+#   python scripts/benchmark.py --update-baseline     stores the results as the new baseline
+# every benchmark runs in a fresh process, so its peak rss is its own
+# a benchmark regresses when its ads/sec drops, or its peak rss grows, by more than --tolerance
+# the baseline is machine-specific (the committed one comes from a 1-cpu container), numbers from
+# other hardware only compare after --update-baseline on that machine
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+DEFAULT_TOLERANCE = 0.25
+
+PAGES_PER_SHARD = 50
+DISCOVERY_SHARDS = 4
+DISCOVERY_WORKERS = 4
+
+def _peak_rss_mb():
+    # linux: VmHWM, which starts over at exec (ru_maxrss would include the parent's peak before the spawn)
+    if os.path.exists('/proc/self/status'):
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    try:
+        import resource
+    except ImportError:  # windows: current rss instead of the peak
+        import psutil
+        return psutil.Process().memory_info().rss / 2 ** 20
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024  # bytes on macos, kilobytes elsewhere
+
+def _get(connection, url):
+    # one keep-alive request, returns (status, body)
+    parts = urlsplit(url)
+    connection.request('GET', f"{parts.path}?{parts.query}" if parts.query else parts.path)
+    response = connection.getresponse()
+    return response.status, response.read().decode('utf-8')
+
+def _listing_worker(engine, base_url):
+    # find_urls._discovery_worker without the browser: same engine, link extraction and state upserts
+    import find_urls
+
+    host = urlsplit(base_url)
+    connection = http.client.HTTPConnection(host.hostname, host.port, timeout=30)
+    try:
+        while True:
+            job = engine.next_job()
+            if job is None:
+                break
+            cursor, page = job
+            page_url = find_urls.listing_page_url(cursor.shard, page)
+            try:
+                status, page_source = _get(connection, page_url)
+            except (OSError, http.client.HTTPException):
+                connection.close()  # reconnects on the next request
+                status, page_source = None, ''
+            if status != 200 or 'a-list' not in page_source:
+                engine.retry_page(cursor, page)
+                continue
+            if find_urls.CARDS_MODE:
+                ad_urls, has_next_page, cards = find_urls.extract_ad_cards(page_source, page_url)
+                engine.record(cursor, page, ad_urls, has_next_page, cards)
+            else:
+                ad_urls, has_next_page = find_urls.extract_ad_urls(page_source, page_url)
+                engine.record(cursor, page, ad_urls, has_next_page)
+    finally:
+        connection.close()
+
+def _discover(base_url, max_pages, state):
+    # every shard up to max_pages with DISCOVERY_WORKERS listing workers, returns the engine
+    import find_urls
+
+    find_urls.BASE_URL = base_url
+    shards = [f"cars/bench-{n}/" for n in range(DISCOVERY_SHARDS)]
+    engine = find_urls.DiscoveryEngine(shards, max_pages=max_pages, state=state)
+    threads = [threading.Thread(target=_listing_worker, args=(engine, base_url)) for _ in range(DISCOVERY_WORKERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return engine
+
+def bench_discovery(base_url, scale, workdir):
+    # listing pages of several shards -> deduplicated ad urls (and cards) in a fresh crawl state
+    from crawl_state import CrawlState
+
+    max_pages = max(1, min(PAGES_PER_SHARD, int(25 * scale)))
+    started = time.perf_counter()
+    with CrawlState(os.path.join(workdir, 'state.sqlite')) as state:
+        engine = _discover(base_url, max_pages, state)
+        seconds = time.perf_counter() - started
+        pages = sum(cursor.pages_done for cursor in engine.cursors)
+        return {'ads': engine.new_in_state, 'seconds': seconds, 'pages': pages}
+
+def bench_fetch(base_url, scale, workdir):
+    # ad pages over the aiohttp backend, with the latency and failures set in BENCHMARKS
+    from fetchers import HttpFetcher
+
+    urls = [f"{base_url}/a/show/{ad_id}" for ad_id in range(1, int(1000 * scale) + 1)]
+    outcomes = {'ok': 0, 'failed': 0}
+
+    def handle(url, html, error):
+        outcomes['failed' if error else 'ok'] += 1
+
+    started = time.perf_counter()
+    HttpFetcher(concurrency=8, timeout=15).fetch_all(urls, handle)
+    return {'ads': outcomes['ok'], 'seconds': time.perf_counter() - started, 'failed': outcomes['failed']}
+
+def bench_parse(base_url, scale, workdir):
+    # parse_html_details on generated ad pages held in memory (100 distinct pages, parsed in turn)
+    from web_scrapping import KOLESA_ALMATY_CONFIG, parse_html_details
+
+    corpus = FixtureCorpus()
+    pages = [(f"{base_url}/a/show/{ad_id}", corpus.ad_page(ad_id)) for ad_id in range(1, 101)]
+    parse_html_details(pages[0][1], pages[0][0], KOLESA_ALMATY_CONFIG)  # compiles the extraction plan
+    ads, complete = int(1000 * scale), 0
+    started = time.perf_counter()
+    for n in range(ads):
+        url, page_source = pages[n % len(pages)]
+        row = parse_html_details(page_source, url, KOLESA_ALMATY_CONFIG)
+        complete += all(row.get(field) for field in KOLESA_ALMATY_CONFIG['essential_fields'])
+    return {'ads': ads, 'seconds': time.perf_counter() - started, 'complete': complete}
+
+def _bench_save(output_format, scale, workdir):
+    # parsed rows through the buffered writer the scraper uses (what save_to_csv used to do)
+    from web_scrapping import KOLESA_ALMATY_CONFIG as config, parse_html_details
+    from writers import open_writer, sink_options
+
+    corpus = FixtureCorpus()
+    templates = [parse_html_details(corpus.ad_page(ad_id), f"https://kolesa.kz/a/show/{ad_id}", config) for ad_id in range(1, 101)]
+    rows = [dict(templates[n % len(templates)], url=f"https://kolesa.kz/a/show/{n}") for n in range(int(100_000 * scale))]
+    path = os.path.join(workdir, 'data.csv' if output_format == 'csv' else 'data')
+    started = time.perf_counter()
+    with open_writer(path, config['columns'], output_format, batch_size=config.get('write_batch_size', 100),
+                     **sink_options(config, output_format)) as writer:
+        for row in rows:
+            writer.write(row)
+    return {'ads': writer.rows_written, 'seconds': time.perf_counter() - started}
+
+def bench_save_csv(base_url, scale, workdir):
+    return _bench_save('csv', scale, workdir)
+
+def bench_save_parquet(base_url, scale, workdir):
+    return _bench_save('parquet', scale, workdir)
+
+def bench_scrape(base_url, scale, workdir):
+    # web_scrapping.parse_urls end to end with the http backend: fetch, parse pool, archive, writer, crawl state
+    from crawl_state import CrawlState, PARSED
+    from web_scrapping import KOLESA_ALMATY_CONFIG, parse_urls
+
+    config = dict(
+        KOLESA_ALMATY_CONFIG,
+        base_url=base_url,
+        fetch_backend='http',
+        http_rate_limit={'initial_rate': 10_000.0, 'max_rate': 10_000.0},  # measure the pipeline, not the pacing
+        metrics_dir=os.path.join(workdir, 'metrics'),
+        page_archive_template=os.path.join(workdir, '{site_name}_pages'),
+    )
+    urls = [f"{base_url}/a/show/{ad_id}" for ad_id in range(1, int(500 * scale) + 1)]
+    with CrawlState(os.path.join(workdir, 'state.sqlite')) as state:
+        state.upsert_urls(urls)
+        started = time.perf_counter()
+        parse_urls(urls, config, state, os.path.join(workdir, 'data.csv'), 'csv')
+        seconds = time.perf_counter() - started
+        return {'ads': state.counts()[PARSED], 'seconds': seconds}
+
+def bench_scrape_cards(base_url, scale, workdir):
+    # discovery in cards mode followed by parse_urls: complete cards are saved without fetching their ad page
+    import find_urls
+    from crawl_state import CrawlState, PARSED
+    from web_scrapping import KOLESA_ALMATY_CONFIG, parse_urls
+
+    find_urls.CARDS_MODE = True
+    config = dict(
+        KOLESA_ALMATY_CONFIG,
+        base_url=base_url,
+        fetch_backend='http',
+        http_rate_limit={'initial_rate': 10_000.0, 'max_rate': 10_000.0},
+        metrics_dir=os.path.join(workdir, 'metrics'),
+        page_archive_template=os.path.join(workdir, '{site_name}_pages'),
+    )
+    max_pages = max(1, min(PAGES_PER_SHARD, int(25 * scale)))
+    with CrawlState(os.path.join(workdir, 'state.sqlite')) as state:
+        started = time.perf_counter()
+        _discover(base_url, max_pages, state)
+        parse_urls(state.urls_to_parse(), config, state, os.path.join(workdir, 'data.csv'), 'csv')
+        seconds = time.perf_counter() - started
+        return {'ads': state.counts()[PARSED], 'seconds': seconds}
+
+# name -> (function, stand-in latency and failure settings)
+BENCHMARKS = {
+    'discovery': (bench_discovery, {'latency_ms': 20, 'jitter_ms': 10}),
+    'fetch': (bench_fetch, {'latency_ms': 20, 'jitter_ms': 20, 'error_rate': 0.02, 'throttle_rate': 0.01, 'captcha_rate': 0.01}),
+    'parse': (bench_parse, {}),
+    'save_csv': (bench_save_csv, {}),
+    'save_parquet': (bench_save_parquet, {}),
+    'scrape': (bench_scrape, {'latency_ms': 20, 'jitter_ms': 10}),
+    'scrape_cards': (bench_scrape_cards, {'latency_ms': 20, 'jitter_ms': 10}),
+}
+
+def _run_benchmark(name, base_url, scale):
+    # runs in a fresh process; the scripts' progress output is swallowed
+    function = BENCHMARKS[name][0]
+    workdir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = function(base_url, scale, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    result['ads_per_sec'] = round(result['ads'] / result['seconds'], 1) if result['seconds'] else None
+    result['seconds'] = round(result['seconds'], 3)
+    result['peak_rss_mb'] = round(_peak_rss_mb(), 1)
+    return result
+
+def run_benchmarks(names, scale=1.0, repeat=1):
+    # returns {name: result}, every result has ads, seconds, ads_per_sec and peak_rss_mb
+    # with repeat > 1 the fastest run of each benchmark is kept
+    results = {}
+    corpus = FixtureCorpus(pages_per_shard=PAGES_PER_SHARD)
+    with StandInServer(corpus) as server:
+        for name in names:
+            for _ in range(max(1, repeat)):
+                server.configure(**BENCHMARKS[name][1])
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                    result = executor.submit(_run_benchmark, name, server.base_url, scale).result()
+                result['requests'] = {key: n for key, n in server.stats.items() if n}
+                if name not in results or result['ads_per_sec'] > results[name]['ads_per_sec']:
+                    results[name] = result
+            result = results[name]
+            print(f"  {name:<14} {result['ads']:>7} ads in {result['seconds']:>7.2f}s  "
+                  f"{result['ads_per_sec']:>9.1f} ads/s  peak rss {result['peak_rss_mb']:>6.1f} MB")
+    return results
+
+def machine_info():
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()}
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    # returns a list of regression messages, empty when every benchmark is within tolerance
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get('results', {}).get(name)
+        if not expected:
+            continue
+        if result['ads_per_sec'] < expected['ads_per_sec'] * (1 - tolerance):
+            change = result['ads_per_sec'] / expected['ads_per_sec'] - 1
+            regressions.append(f"{name}: {result['ads_per_sec']} ads/s vs baseline {expected['ads_per_sec']} ({change:+.0%})")
+        if result['peak_rss_mb'] > expected['peak_rss_mb'] * (1 + tolerance):
+            change = result['peak_rss_mb'] / expected['peak_rss_mb'] - 1
+            regressions.append(f"{name}: peak rss {result['peak_rss_mb']} MB vs baseline {expected['peak_rss_mb']} MB ({change:+.0%})")
+    return regressions
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def save_baseline(results, scale, path=BASELINE_PATH):
+    baseline = load_baseline(path) or {}
+    baseline.update({
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'machine': machine_info(),
+        'scale': scale,
+    })
+    baseline.setdefault('results', {}).update(
+        {name: {'ads_per_sec': result['ads_per_sec'], 'peak_rss_mb': result['peak_rss_mb']} for name, result in results.items()}
+    )
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="offline throughput benchmarks against a local kolesa.kz stand-in")
+    parser.add_argument('benchmarks', nargs='*', help=f"any of {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument('--scale', type=float, default=1.0, help="multiplies the number of ads of every benchmark")
+    parser.add_argument('--repeat', type=int, default=1, help="runs of every benchmark, the fastest one counts")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown / memory growth, 0.25 = 25%%")
+    parser.add_argument('--update-baseline', action='store_true', help="save the results as the new baseline")
+    parser.add_argument('--json', default=None, help="also write the results to this file")
+    args = parser.parse_args()
+    names = args.benchmarks or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    print(f"running {len(names)} benchmark(s), scale {args.scale}, {machine_info()}")
+    results = run_benchmarks(names, args.scale, args.repeat)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'machine': machine_info(), 'scale': args.scale, 'results': results}, f, ensure_ascii=False, indent=2)
+
+    if args.update_baseline:
+        save_baseline(results, args.scale, args.baseline)
+        print(f"baseline saved to {args.baseline}")
+        sys.exit(0)
+
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(f"no baseline at {args.baseline}, run with --update-baseline to create one")
+        sys.exit(0)
+    if baseline.get('machine') != machine_info() or baseline.get('scale') != args.scale:
+        print(f"warning: baseline was recorded on {baseline.get('machine')} at scale {baseline.get('scale')}, "
+              f"not on this machine; regressions below may be hardware differences, "
+              f"run with --update-baseline here first for a meaningful check")
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("\n" + "!" * 70)
+        print(f"PERFORMANCE REGRESSION ({len(regressions)}), tolerance {args.tolerance:.0%}:")
+        for message in regressions:
+            print(f"  {message}")
+        print("!" * 70)
+        sys.exit(1)
+    print(f"no regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
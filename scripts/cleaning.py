@@ -0,0 +1,206 @@
+import os
+import shutil
+import argparse
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# cleaning steps of notebooks/cleaning-analysis.ipynb as an importable module:
+#   clean_frame(df)                  -> cleaned copy of an in-memory frame (what the notebook uses)
+#   clean_file(input, output)        -> streams a raw data file through the same steps in chunks,
+#                                       into a csv file or a parquet dataset partitioned by parsed_at date
+# the fill values (mean mileage per year, median mileage, most common color) need the whole file,
+# so clean_file reads it twice: once to collect them, once to clean and write every chunk
+
+CATEGORICAL_COLUMNS = ['brand', 'model', 'city', 'color', 'body_style', 'transmission', 'drive_type']
+
+# ads dropped by hand after looking at the price outliers (brand, model)
+# the 1993 mercedes-benz s 600 is priced like a new car
+DROPPED_MODELS = [('Mercedes-Benz', 'S 600')]
+
+def read_chunks(path, chunksize=500_000):
+    # yields raw frames from a csv file or a parquet file / dataset written by the scraper
+    if os.path.isdir(path) or path.endswith('.parquet'):
+        import pyarrow as pa
+        from dataset import open_dataset, PARTITION_DATE
+        # a dataset yields one small batch per row group, they are merged into chunks of about chunksize rows
+        batches, rows = [], 0
+        for batch in open_dataset(path).to_batches(batch_size=chunksize):
+            batches.append(batch)
+            rows += batch.num_rows
+            if rows >= chunksize:
+                yield pa.Table.from_batches(batches).to_pandas().drop(columns=[PARTITION_DATE], errors='ignore')
+                batches, rows = [], 0
+        if rows:
+            yield pa.Table.from_batches(batches).to_pandas().drop(columns=[PARTITION_DATE], errors='ignore')
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize, dtype={'brand': str, 'model': str, 'url': str})
+
+def split_brand(df):
+    # the listing title lands in 'brand' ("Toyota Camry"): first word is the brand, the rest the model
+    # like the notebook, this always replaces the scraped 'model' column
+    parts = df['brand'].str.split(' ', n=1, expand=True).reindex(columns=[0, 1])
+    df['brand'] = parts[0]
+    df['model'] = parts[1]
+    return df
+
+def _to_numeric(df):
+    for col in ['year', 'price', 'mileage', 'engine_volume_liters']:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    df['parsed_at'] = pd.to_datetime(df['parsed_at'], errors='coerce')
+    return df
+
+class FillValues:
+    # statistics the imputation needs, collected over one or more chunks of raw data
+    def __init__(self):
+        self._mileage_sum = pd.Series(dtype='float64')
+        self._mileage_count = pd.Series(dtype='int64')
+        self._mileage = []  # observed mileages as float32, for the overall median
+        self._colors = pd.Series(dtype='int64')
+
+    def update(self, df):
+        observed = df.loc[df['mileage'].notna(), ['year', 'mileage']]
+        by_year = observed.groupby('year')['mileage']
+        self._mileage_sum = self._mileage_sum.add(by_year.sum(), fill_value=0)
+        self._mileage_count = self._mileage_count.add(by_year.count(), fill_value=0)
+        self._mileage.append(observed['mileage'].to_numpy(dtype=np.float32))
+        self._colors = self._colors.add(df['color'].value_counts(), fill_value=0)
+
+    def finalize(self):
+        self.mileage_by_year = self._mileage_sum / self._mileage_count
+        mileage = np.concatenate(self._mileage) if self._mileage else np.array([], dtype=np.float32)
+        self.mileage_median = float(np.median(mileage)) if len(mileage) else 0.0
+        self._mileage = []
+        # ties go to the alphabetically first color, like Series.mode()
+        self.color_mode = self._colors.sort_index().idxmax() if len(self._colors) else None
+        return self
+
+def clean_chunk(df, fill_values, dropped_models=DROPPED_MODELS):
+    # every step works on whole columns, chunks can be cleaned independently once fill_values are known
+    # mileage: 0 for cars of the listing year or newer (new cars), then the mean of the car's year,
+    # then the overall median for years without any mileage
+    listing_year = df['parsed_at'].dt.year.fillna(datetime.now().year)
+    mileage = df['mileage'].mask(df['mileage'].isna() & (df['year'] >= listing_year), 0)
+    mileage = mileage.fillna(df['year'].map(fill_values.mileage_by_year))
+    df['mileage'] = mileage.fillna(fill_values.mileage_median).round(0)
+
+    # missing engine volume means an electric car
+    df['engine_volume_liters'] = df['engine_volume_liters'].fillna(0)
+    # retro cars come without a body style and are left out
+    df = df.dropna(subset=['body_style'])
+    df = df.assign(color=df['color'].fillna(fill_values.color_mode))
+
+    if dropped_models:
+        dropped = pd.MultiIndex.from_tuples(dropped_models)
+        df = df[~pd.MultiIndex.from_frame(df[['brand', 'model']]).isin(dropped)]
+    return df
+
+def optimize_dtypes(df):
+    # categories for the repeated text columns, the smallest numeric types that hold the values
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    df['year'] = pd.to_numeric(df['year'], downcast='integer') if df['year'].notna().all() else df['year'].astype('Int16')
+    df['price'] = pd.to_numeric(df['price'], downcast='integer') if df['price'].notna().all() else df['price'].astype('Int64')
+    df['mileage'] = pd.to_numeric(df['mileage'].astype('int64'), downcast='integer')
+    df['engine_volume_liters'] = df['engine_volume_liters'].astype('float32')
+    return df
+
+def clean_frame(df, dropped_models=DROPPED_MODELS):
+    # cleans a raw frame held in memory, fill values come from the frame itself
+    df = _to_numeric(split_brand(df.copy()))
+    fill_values = FillValues()
+    fill_values.update(df)
+    df = clean_chunk(df, fill_values.finalize(), dropped_models)
+    return optimize_dtypes(df.reset_index(drop=True))
+
+def _reset_dataset_dir(path):
+    # the cleaned dataset is rebuilt on every run, like the csv file is overwritten
+    from dataset import PARTITION_DATE
+    if not os.path.exists(path):
+        return
+    if not os.path.isdir(path) or any(not name.startswith(f"{PARTITION_DATE}=") for name in os.listdir(path)):
+        raise ValueError(f"'{path}' is not a cleaned parquet dataset, refusing to overwrite it")
+    shutil.rmtree(path)
+
+def _write_dataset_chunk(chunk, path, chunk_number, partition_by_city):
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    from dataset import PARTITION_DATE, PARTITION_CITY
+
+    fields = [pa.field(PARTITION_DATE, pa.date32())]
+    if partition_by_city:
+        fields.append(pa.field(PARTITION_CITY, pa.string()))
+        chunk = chunk.assign(city=chunk['city'].astype(str))
+    table = pa.Table.from_pandas(chunk.assign(**{PARTITION_DATE: chunk['parsed_at'].dt.date}), preserve_index=False)
+    ds.write_dataset(
+        table, path, format='parquet',
+        partitioning=ds.partitioning(pa.schema(fields), flavor='hive'),
+        basename_template=f"part-{chunk_number:05d}-{{i}}.parquet",
+        existing_data_behavior='overwrite_or_ignore',
+    )
+
+def clean_file(input_path, output_path, chunksize=500_000, dropped_models=DROPPED_MODELS,
+               output_format='csv', partition_by_city=False):
+    # two passes over input_path with at most one chunk in memory; returns (rows read, rows written)
+    # output_format 'parquet' writes a dataset directory partitioned by parsed_at date (and city), see dataset.py
+    if output_format == 'parquet':
+        _reset_dataset_dir(output_path)
+    fill_values = FillValues()
+    rows_in = 0
+    for chunk in read_chunks(input_path, chunksize):
+        fill_values.update(_to_numeric(chunk))
+        rows_in += len(chunk)
+    fill_values.finalize()
+    print(f"collected fill values from {rows_in} rows: median mileage {fill_values.mileage_median:.0f}, most common color {fill_values.color_mode}")
+
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    rows_out = 0
+    for chunk_number, chunk in enumerate(read_chunks(input_path, chunksize)):
+        chunk = optimize_dtypes(clean_chunk(_to_numeric(split_brand(chunk)), fill_values, dropped_models))
+        if output_format == 'parquet':
+            _write_dataset_chunk(chunk, output_path, chunk_number, partition_by_city)
+        else:
+            chunk.to_csv(output_path, mode='w' if chunk_number == 0 else 'a', header=chunk_number == 0, index=False)
+        rows_out += len(chunk)
+    return rows_in, rows_out
+
+def load_cleaned(path, columns=None, start=None, end=None, **equals):
+    # reads cleaned data back with the same compact dtypes
+    # a parquet dataset only reads the requested columns, parsed_at dates and matching rows (dataset.load_listings)
+    if os.path.isdir(path):
+        from dataset import load_listings, PARTITION_DATE
+        df = load_listings(path, columns, start, end, **equals).drop(columns=[PARTITION_DATE], errors='ignore')
+        for col in CATEGORICAL_COLUMNS:
+            if col in df.columns:
+                df[col] = df[col].astype('category')
+        for col in ['year', 'price', 'mileage']:
+            if col in df.columns and df[col].notna().all():
+                df[col] = pd.to_numeric(df[col], downcast='integer')
+        return df
+
+    dtypes = {col: 'category' for col in CATEGORICAL_COLUMNS}
+    dtypes['engine_volume_liters'] = 'float32'
+    df = pd.read_csv(path, dtype=dtypes, parse_dates=['parsed_at'], usecols=columns)
+    for col in ['year', 'price', 'mileage']:
+        df[col] = pd.to_numeric(df[col], downcast='integer')
+    return df
+
+if __name__ == "__main__":
+    # usage: python scripts/cleaning.py [input] [output] [--chunksize N] [--format parquet [--partition-by-city]]
+    parser = argparse.ArgumentParser(description="clean the raw kolesa.kz data file")
+    parser.add_argument('input', nargs='?', default='data/kolesa_almaty_data.csv')
+    parser.add_argument('output', nargs='?', default=None)
+    parser.add_argument('--chunksize', type=int, default=500_000)
+    parser.add_argument('--format', default='csv', choices=['csv', 'parquet'])
+    parser.add_argument('--partition-by-city', action='store_true')
+    args = parser.parse_args()
+    output = args.output or ('data/kolesa_almaty_cleaned' if args.format == 'parquet' else 'data/kolesa_almaty_cleaned.csv')
+
+    start_time = datetime.now()
+    rows_in, rows_out = clean_file(args.input, output, args.chunksize,
+                                   output_format=args.format, partition_by_city=args.partition_by_city)
+    print(f"cleaned {rows_in} rows into {rows_out} rows in {(datetime.now() - start_time).total_seconds():.1f}s: {output}")
@@ -0,0 +1,301 @@
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+# on-disk crawl state shared by find_urls.py and web_scrapping.py
+# one row per ad url with its status, so a restart only looks at the work that is left
+
+PENDING = 'pending'
+PARSED = 'parsed'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+STATUSES = (PENDING, PARSED, SKIPPED, FAILED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    last_attempt TEXT,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_urls_status ON urls (status, attempts);
+CREATE TABLE IF NOT EXISTS history (
+    url TEXT NOT NULL,
+    observed_at TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (url, observed_at, fingerprint)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cards (
+    url TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    missing TEXT NOT NULL,
+    seen_at TEXT NOT NULL
+);
+"""
+
+# revisit bookkeeping, added to stores created before it existed
+_REVISIT_COLUMNS = {
+    'fingerprint': "TEXT",  # fingerprint of the fields of the latest version
+    'visits': "INTEGER NOT NULL DEFAULT 0",  # successful parses
+    'versions': "INTEGER NOT NULL DEFAULT 0",  # rows in the history table
+    'changes': "INTEGER NOT NULL DEFAULT 0",  # visits that found different fields
+    'last_parsed': "TEXT",
+    'next_visit': "TEXT",
+    'revisit_failures': "INTEGER NOT NULL DEFAULT 0",  # failed revisits since the last successful parse
+}
+
+# outcomes of record_version
+FIRST = 'first'  # not in the output file yet
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+class CrawlState:
+    # sqlite-backed url registry; safe to share between worker threads
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(urls)")}
+        with self._conn:
+            for column, definition in _REVISIT_COLUMNS.items():
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE urls ADD COLUMN {column} {definition}")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_urls_next_visit ON urls (status, next_visit)")
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def is_empty(self):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM urls LIMIT 1").fetchone() is None
+
+    def upsert_urls(self, urls, status=PENDING):
+        # adds new urls with the given status and refreshes last_seen on known ones
+        # returns the number of urls that were not in the store before
+        urls = list(urls)
+        now = _now()
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO urls (url, status, first_seen, last_seen) VALUES (?, ?, ?, ?)",
+                ((url, status, now, now) for url in urls),
+            )
+            inserted = self._conn.total_changes - before
+            self._conn.executemany("UPDATE urls SET last_seen = ? WHERE url = ?", ((now, url) for url in urls))
+        return inserted
+
+    def import_parsed(self, urls):
+        # urls that are already in the output file: added as 'parsed', known urls in any other status become 'parsed'
+        # returns the number of urls whose status changed
+        urls = list(urls)
+        now = _now()
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT INTO urls (url, status, first_seen, last_seen) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET status = excluded.status WHERE status != excluded.status",
+                ((url, PARSED, now, now) for url in urls),
+            )
+            return self._conn.total_changes - before
+
+    def get_meta(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def mark(self, url, status, error=None):
+        # records the outcome of one attempt
+        self.mark_many([url], status, error)
+
+    def mark_many(self, urls, status, error=None):
+        # records the same outcome for several urls in one transaction
+        urls = list(urls)
+        if status not in STATUSES:
+            raise ValueError(f"unknown status '{status}'")
+        now = _now()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO urls (url, status, attempts, first_seen, last_seen, last_attempt, last_error) "
+                "VALUES (?, ?, 1, ?, ?, ?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET status = excluded.status, attempts = attempts + 1, "
+                "last_attempt = excluded.last_attempt, last_error = excluded.last_error",
+                ((url, status, now, now, now, error) for url in urls),
+            )
+
+    def urls_to_parse(self, max_attempts=3, limit=None):
+        # pending urls plus failed ones that still have attempts left, oldest first
+        query = ("SELECT url FROM urls WHERE status = ? OR (status = ? AND attempts < ?) "
+                 "ORDER BY first_seen, rowid")
+        params = [PENDING, FAILED, max_attempts]
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return [row[0] for row in self._conn.execute(query, params)]
+
+    def all_urls(self, limit=None):
+        query = "SELECT url FROM urls ORDER BY first_seen, rowid"
+        params = []
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return [row[0] for row in self._conn.execute(query, params)]
+
+    def iter_urls(self, batch_size=10000):
+        # streams every known url without building the whole list first
+        with self._lock:
+            cursor = self._conn.execute("SELECT url FROM urls")
+            rows = cursor.fetchmany(batch_size)
+        while rows:
+            for row in rows:
+                yield row[0]
+            with self._lock:
+                rows = cursor.fetchmany(batch_size)
+
+    def counts(self):
+        # number of urls per status
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM urls GROUP BY status").fetchall()
+        counts = {status: 0 for status in STATUSES}
+        counts.update(dict(rows))
+        return counts
+
+    def record_version(self, url, data, fingerprint, next_visit_hours):
+        # stores a successful parse: a new history row when the fields changed, and the next visit time
+        # next_visit_hours(first_seen, visits, changes, changed) -> hours until the url is due again
+        # returns FIRST for urls that are not 'parsed' yet (the caller saves the row to the output),
+        # CHANGED or UNCHANGED for revisits, which are marked 'parsed' here
+        now = datetime.now()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT status, fingerprint, first_seen, visits, changes FROM urls WHERE url = ?", (url,)
+            ).fetchone()
+            status, previous, first_seen, visits, changes = row or (PENDING, None, _now(), 0, 0)
+            is_new_version = fingerprint != previous
+            changed = is_new_version and previous is not None
+            if is_new_version:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO history (url, observed_at, fingerprint, data) VALUES (?, ?, ?, ?)",
+                    (url, now.strftime('%Y-%m-%d %H:%M:%S'), fingerprint, json.dumps(data, ensure_ascii=False, default=str)),
+                )
+            visits += 1
+            changes += int(changed)
+            hours = next_visit_hours(datetime.strptime(first_seen, '%Y-%m-%d %H:%M:%S'), visits, changes, changed)
+            next_visit = (now + timedelta(hours=hours)).strftime('%Y-%m-%d %H:%M:%S')
+            self._conn.execute(
+                "INSERT INTO urls (url, first_seen, last_seen) VALUES (?, ?, ?) ON CONFLICT(url) DO NOTHING",
+                (url, _now(), _now()),
+            )
+            self._conn.execute(
+                "UPDATE urls SET fingerprint = ?, visits = ?, changes = ?, versions = versions + ?, "
+                "last_parsed = ?, next_visit = ?, revisit_failures = 0 WHERE url = ?",
+                (fingerprint, visits, changes, int(is_new_version), _now(), next_visit, url),
+            )
+            if status != PARSED:
+                return FIRST
+            self._conn.execute(
+                "UPDATE urls SET attempts = attempts + 1, last_attempt = ?, last_error = NULL WHERE url = ?",
+                (_now(), url),
+            )
+        return CHANGED if changed else UNCHANGED
+
+    def reschedule(self, url, hours, error=None):
+        # a revisit failed: the url stays 'parsed' and is tried again in `hours`
+        next_visit = (datetime.now() + timedelta(hours=hours)).strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE urls SET next_visit = ?, attempts = attempts + 1, revisit_failures = revisit_failures + 1, "
+                "last_attempt = ?, last_error = ? WHERE url = ?",
+                (next_visit, _now(), error, url),
+            )
+
+    def urls_due(self, limit=None, max_attempts=None):
+        # parsed urls whose next visit has come, urls parsed before revisits existed first
+        # max_attempts: urls whose revisits failed this many times in a row are retired (removed ads)
+        query = "SELECT url FROM urls WHERE status = ? AND (next_visit IS NULL OR next_visit <= ?)"
+        params = [PARSED, _now()]
+        if max_attempts is not None:
+            query += " AND revisit_failures < ?"
+            params.append(max_attempts)
+        query += " ORDER BY next_visit IS NOT NULL, next_visit, first_seen"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return [row[0] for row in self._conn.execute(query, params)]
+
+    def retired_count(self, max_attempts):
+        # parsed urls that are no longer revisited, see urls_due
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM urls WHERE status = ? AND revisit_failures >= ?", (PARSED, max_attempts)
+            ).fetchone()[0]
+
+    def save_cards(self, cards):
+        # fields of listing cards (find_urls.py cards mode) as (url, fields, missing columns)
+        # a card seen again replaces the older one, its price may have changed
+        now = _now()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO cards (url, data, missing, seen_at) VALUES (?, ?, ?, ?)",
+                ((url, json.dumps(fields, ensure_ascii=False, default=str), ','.join(missing), now)
+                 for url, fields, missing in cards),
+            )
+
+    def cards(self, urls, batch_size=500):
+        # {url: (card fields, missing columns)} for the given urls that have a stored card
+        urls = list(urls)
+        found = {}
+        with self._lock:
+            for start in range(0, len(urls), batch_size):
+                batch = urls[start:start + batch_size]
+                rows = self._conn.execute(
+                    f"SELECT url, data, missing FROM cards WHERE url IN ({','.join('?' * len(batch))})", batch
+                )
+                for url, data, missing in rows:
+                    found[url] = (json.loads(data), [col for col in missing.split(',') if col])
+        return found
+
+    def history(self, url=None):
+        # (url, observed_at, fingerprint, fields) of every stored version, oldest first
+        query = "SELECT url, observed_at, fingerprint, data FROM history"
+        params = []
+        if url is not None:
+            query += " WHERE url = ?"
+            params.append(url)
+        query += " ORDER BY url, observed_at"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [(url, observed_at, fingerprint, json.loads(data)) for url, observed_at, fingerprint, data in rows]
@@ -0,0 +1,98 @@
+import os
+import glob
+from datetime import date, datetime
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+# parquet dataset layout shared by the scraper output and the cleaned data:
+#   <root>/parsed_date=2025-04-10/[city=Алматы/]part-....parquet
+# hive-style partition directories let a reader skip every day (and city) it does not ask for,
+# typed columns and row group statistics let it skip the rest without parsing text
+
+PARTITION_DATE = 'parsed_date'
+PARTITION_CITY = 'city'
+
+# arrow type for every selector type in config['selectors']
+ARROW_TYPES = {
+    'text': pa.string(),
+    'numeric': pa.int64(),
+    'float': pa.float64(),
+}
+
+def column_types(config):
+    # selector type of every output column; columns without a selector are text
+    types = {}
+    for column, rule in config.get('selectors', {}).items():
+        if column == 'details_block':
+            for target_info in rule.get('mapping', {}).values():
+                if isinstance(target_info, dict) and target_info.get('column'):
+                    types[target_info['column']] = target_info.get('type', 'text')
+        elif isinstance(rule, dict):
+            types[column] = rule.get('type', 'text')
+    return {column: types.get(column, 'text') for column in config['columns']}
+
+def arrow_schema(config):
+    # schema of the scraped rows; parsed_at is stored as a timestamp
+    fields = []
+    for column, column_type in column_types(config).items():
+        if column == 'parsed_at':
+            fields.append(pa.field(column, pa.timestamp('s')))
+        else:
+            fields.append(pa.field(column, ARROW_TYPES.get(column_type, pa.string())))
+    return pa.schema(fields)
+
+def partition_dir(parsed_at, city=None, partition_by_city=False):
+    # relative directory of one row; uri-escaped like pyarrow does it
+    if isinstance(parsed_at, (datetime, date)):
+        day = parsed_at.strftime('%Y-%m-%d')
+    else:
+        day = str(parsed_at)[:10] if parsed_at else '__HIVE_DEFAULT_PARTITION__'
+    parts = [f"{PARTITION_DATE}={day}"]
+    if partition_by_city:
+        parts.append(f"{PARTITION_CITY}={quote(city, safe='') if city else '__HIVE_DEFAULT_PARTITION__'}")
+    return os.path.join(*parts)
+
+def open_dataset(path):
+    # dataset over a directory written by ParquetSink or cleaning.py, partition columns included
+    fields = [pa.field(PARTITION_DATE, pa.date32())]
+    if glob.glob(os.path.join(path, f"{PARTITION_DATE}=*", f"{PARTITION_CITY}=*")):
+        fields.append(pa.field(PARTITION_CITY, pa.string()))
+    partitioning = ds.partitioning(pa.schema(fields), flavor='hive')
+    return ds.dataset(path, format='parquet', partitioning=partitioning)
+
+def _as_date(value):
+    if value is None or isinstance(value, date) and not isinstance(value, datetime):
+        return value
+    if isinstance(value, datetime):
+        return value.date()
+    return date.fromisoformat(str(value)[:10])
+
+def build_filter(start=None, end=None, **equals):
+    # start/end: inclusive parsed_at dates; equals: column=value or column=[values]
+    conditions = []
+    if start is not None:
+        conditions.append(ds.field(PARTITION_DATE) >= _as_date(start))
+    if end is not None:
+        conditions.append(ds.field(PARTITION_DATE) <= _as_date(end))
+    for column, value in equals.items():
+        if isinstance(value, (list, tuple, set)):
+            conditions.append(ds.field(column).isin(list(value)))
+        else:
+            conditions.append(ds.field(column) == value)
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+def load_listings(path, columns=None, start=None, end=None, filter=None, **equals):
+    # reads only the partitions between start and end, only the listed columns,
+    # and only the row groups whose statistics can match the equality filters
+    #   load_listings('data/kolesa_almaty_data', ['brand', 'model', 'price'],
+    #                 start='2025-04-01', end='2025-04-30', brand='Toyota Camry')  # raw brand is the whole title
+    dataset = open_dataset(path)
+    expression = build_filter(start, end, **equals)
+    if filter is not None:
+        expression = filter if expression is None else expression & filter
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
@@ -0,0 +1,157 @@
+import os
+import threading
+
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service as ChromeService
+from selenium.webdriver.chrome.options import Options as ChromeOptions
+from selenium.common.exceptions import SessionNotCreatedException, WebDriverException
+
+try:
+    import psutil
+except ImportError:  # memory based recycling is skipped without psutil
+    psutil = None
+
+# chrome setup shared by find_urls.py and web_scrapping.py
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36"
+
+# resources the parsers never look at; blocked through the devtools protocol
+BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+]
+BLOCKED_CSS_PATTERNS = ["*.css"]
+
+DRIVER_PATH_ENV = "CHROMEDRIVER_PATH"
+DRIVER_PATH_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "kolesa-scraper", "chromedriver_path")
+
+_driver_path_lock = threading.Lock()
+
+def resolve_driver_path(refresh=False):
+    # chromedriver location without touching the network when possible:
+    # $CHROMEDRIVER_PATH, then the path cached by the last download, then webdriver-manager
+    with _driver_path_lock:
+        env_path = os.environ.get(DRIVER_PATH_ENV)
+        if env_path and not refresh:
+            return env_path
+        if not refresh and os.path.exists(DRIVER_PATH_CACHE):
+            with open(DRIVER_PATH_CACHE, encoding='utf-8') as f:
+                cached_path = f.read().strip()
+            if cached_path and os.path.exists(cached_path):
+                return cached_path
+
+        from webdriver_manager.chrome import ChromeDriverManager
+        print("resolving chromedriver with webdriver-manager (network)...")
+        driver_path = ChromeDriverManager().install()
+        os.makedirs(os.path.dirname(DRIVER_PATH_CACHE), exist_ok=True)
+        with open(DRIVER_PATH_CACHE, 'w', encoding='utf-8') as f:
+            f.write(driver_path)
+        return driver_path
+
+def build_chrome_options(headless=True, block_images=True, page_load_strategy='eager'):
+    # anti-detection options used by both scripts plus the resource trimming switches
+    chrome_options = ChromeOptions()
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--window-size=1280,800")
+    if headless:
+        chrome_options.add_argument("--headless=new")
+    chrome_options.add_argument(f'user-agent={USER_AGENT}')
+    chrome_options.add_argument("--disable-blink-features=AutomationControlled")
+    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    chrome_options.add_experimental_option('useAutomationExtension', False)
+    if block_images:
+        chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+        chrome_options.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+        })
+    # 'eager' returns from driver.get() at DOMContentLoaded instead of waiting for every subresource
+    chrome_options.page_load_strategy = page_load_strategy
+    return chrome_options
+
+def create_driver(headless=True, block_images=True, block_css=False, page_load_strategy='eager', driver_path=None):
+    # starts a trimmed chrome instance
+    options = build_chrome_options(headless, block_images, page_load_strategy)
+    driver_path = driver_path or resolve_driver_path()
+    try:
+        driver = webdriver.Chrome(service=ChromeService(driver_path), options=options)
+    except SessionNotCreatedException:
+        # cached chromedriver no longer matches the installed chrome
+        driver_path = resolve_driver_path(refresh=True)
+        driver = webdriver.Chrome(service=ChromeService(driver_path), options=options)
+    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+    if block_images or block_css:
+        patterns = (BLOCKED_URL_PATTERNS if block_images else []) + (BLOCKED_CSS_PATTERNS if block_css else [])
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+    return driver
+
+class ManagedDriver:
+    # one chrome instance for one worker that is replaced
+    #  - after max_pages pages (long sessions slowly bloat),
+    #  - when chrome + chromedriver use more than max_memory_mb (checked every memory_check_every pages),
+    #  - after a crash reported through discard()
+    # the next access to .driver starts a fresh instance
+    def __init__(self, headless=True, block_images=True, block_css=False, page_load_strategy='eager',
+                 max_pages=200, max_memory_mb=1500, memory_check_every=10, name="driver"):
+        self.options = dict(headless=headless, block_images=block_images, block_css=block_css,
+                            page_load_strategy=page_load_strategy)
+        self.max_pages = max_pages
+        self.max_memory_mb = max_memory_mb
+        self.memory_check_every = memory_check_every
+        self.name = name
+        self.pages = 0
+        self.restarts = 0
+        self._driver = None
+
+    @property
+    def driver(self):
+        if self._driver is None:
+            self._driver = create_driver(**self.options)
+            self.pages = 0
+        return self._driver
+
+    def page_done(self):
+        # call after every page, recycles the browser when it is due
+        self.pages += 1
+        if self.max_pages and self.pages >= self.max_pages:
+            print(f"[{self.name}] recycling webdriver after {self.pages} pages.")
+            self.recycle()
+        elif self.max_memory_mb and psutil and self.pages % self.memory_check_every == 0:
+            memory_mb = self.memory_mb()
+            if memory_mb is not None and memory_mb > self.max_memory_mb:
+                print(f"[{self.name}] recycling webdriver at {memory_mb:.0f} mb.")
+                self.recycle()
+
+    def memory_mb(self):
+        # resident memory of chromedriver and every chrome process it started
+        try:
+            process = psutil.Process(self._driver.service.process.pid)
+            processes = [process] + process.children(recursive=True)
+            return sum(p.memory_info().rss for p in processes) / (1024 * 1024)
+        except (AttributeError, psutil.Error):
+            return None
+
+    def discard(self):
+        # drops a session that may be dead, the next page gets a new browser
+        self.restarts += 1
+        self.recycle()
+
+    def recycle(self):
+        driver, self._driver = self._driver, None
+        if driver is not None:
+            try:
+                driver.quit()
+            except WebDriverException:
+                pass  # the session is already gone
+
+    def quit(self):
+        self.recycle()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.quit()
+        return False
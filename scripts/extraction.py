@@ -0,0 +1,190 @@
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+import lxml.html
+from lxml import etree
+from cssselect import HTMLTranslator
+
+# compiled extraction of ad fields straight from the lxml tree
+# the config is turned into an ExtractionPlan once, every page then only runs precompiled xpaths
+
+def clean_text(text):
+    # removes extra spaces from text
+    return ' '.join(text.split()) if text else None
+
+def extract_numeric(text):
+    # extracts numeric value from text
+    if not text: return None
+    digits = re.findall(r'\d+', str(text))
+    return int("".join(digits)) if digits else None
+
+def extract_float(text):
+    # extracts floating-point number from text
+    if not text: return None
+    match = re.search(r'(\d[\d\s]*[.,]?\d*)', str(text).replace(' ', ''))
+    if match:
+        try:
+            return float(match.group(1).replace(',', '.'))
+        except ValueError:
+            return None
+    return None
+
+def _as_text(text):
+    return text
+
+COERCERS = {
+    'text': _as_text,
+    'numeric': extract_numeric,
+    'float': extract_float,
+}
+
+# same strings beautifulsoup's .text returns: no script/style/template content, no comments
+_ELEMENT_TEXT = etree.XPath("descendant-or-self::text()[not(parent::script or parent::style or ancestor::template)]")
+_HTML_PARSER = lxml.html.HTMLParser(encoding='utf-8')
+_CSS_TRANSLATOR = HTMLTranslator()
+
+def element_text(element):
+    return ''.join(_ELEMENT_TEXT(element))
+
+def parse_html(page_source):
+    # returns the lxml document root, or None for an empty page
+    if isinstance(page_source, str):
+        page_source = page_source.encode('utf-8')
+    try:
+        return lxml.html.document_fromstring(page_source, parser=_HTML_PARSER)
+    except etree.ParserError:
+        return None
+
+def compile_selector(selector, scoped=False):
+    # css -> compiled xpath; scoped selectors only match below the context element (like soup.select on a tag)
+    if not selector:
+        return None
+    prefix = 'descendant::' if scoped else 'descendant-or-self::'
+    return etree.XPath(_CSS_TRANSLATOR.css_to_xpath(selector, prefix=prefix))
+
+class ExtractionPlan:
+    # precompiled form of config['selectors'] plus the output columns
+    def __init__(self, config):
+        self.columns = list(config['columns'])
+        selectors_config = config.get('selectors', {})
+        self.has_city_alt = 'city_alt' in selectors_config
+        self.steps = []  # ('field', column, xpath, coercer) or ('details', block_xpath, key_xpath, value_xpath, mapping)
+
+        for column, rule in selectors_config.items():
+            if column == 'details_block':
+                mapping = {}
+                for key_text, target_info in rule.get('mapping', {}).items():
+                    target_column = target_info.get('column') if isinstance(target_info, dict) else target_info
+                    target_type = target_info.get('type', 'text') if isinstance(target_info, dict) else 'text'
+                    if target_column:
+                        mapping[key_text] = (target_column, COERCERS.get(target_type, _as_text))
+                self.steps.append((
+                    'details',
+                    compile_selector(rule.get('block_selector', '')),
+                    compile_selector(rule.get('key_selector', ''), scoped=True),
+                    compile_selector(rule.get('value_selector', ''), scoped=True),
+                    mapping,
+                ))
+            elif isinstance(rule, dict):
+                coercer = COERCERS.get(rule.get('type', 'text'), _as_text)
+                self.steps.append(('field', column, compile_selector(rule.get('selector')), coercer))
+            elif isinstance(rule, str):
+                self.steps.append(('field', column, compile_selector(rule), _as_text))
+
+    def extract(self, page_source, url):
+        # same result as the original beautifulsoup-based parse_html_details
+        extracted_data = {
+            'url': url,
+            'parsed_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        root = parse_html(page_source)
+
+        if root is not None:
+            for step in self.steps:
+                if step[0] == 'details':
+                    _, block_xpath, key_xpath, value_xpath, mapping = step
+                    if block_xpath is None or key_xpath is None or value_xpath is None:
+                        continue
+                    for block in block_xpath(root):
+                        key_elements = key_xpath(block)
+                        value_elements = value_xpath(block)
+                        if key_elements and value_elements:
+                            target = mapping.get(clean_text(element_text(key_elements[0])))
+                            if target:
+                                target_column, coercer = target
+                                extracted_data[target_column] = coercer(clean_text(element_text(value_elements[0])))
+                else:
+                    _, column, xpath, coercer = step
+                    elements = xpath(root) if xpath is not None else None
+                    if elements:
+                        extracted_data[column] = coercer(clean_text(element_text(elements[0])))
+
+        # fallback logic for city
+        if not extracted_data.get('city'):
+            if self.has_city_alt and 'city_alt' in extracted_data:
+                extracted_data['city'] = extracted_data.pop('city_alt', None)
+
+        return {col: extracted_data.get(col) for col in self.columns}
+
+_PLANS = {}
+
+def get_extraction_plan(config):
+    # compiles a config once and reuses the plan for every page
+    cached = _PLANS.get(id(config))
+    if cached is None or cached[0] is not config:
+        cached = (config, ExtractionPlan(config))
+        _PLANS[id(config)] = cached
+    return cached[1]
+
+def benchmark(page_dir, config, repeat=3):
+    # times the compiled plan against the beautifulsoup reference on a folder of saved ad pages
+    # and checks that both return the same fields
+    from web_scrapping import parse_html_details_bs4
+
+    pages = []
+    for name in sorted(os.listdir(page_dir)):
+        if name.endswith(('.html', '.htm')):
+            with open(os.path.join(page_dir, name), encoding='utf-8') as f:
+                pages.append((name, f.read()))
+    if not pages:
+        print(f"no .html files found in {page_dir}")
+        return
+
+    plan = get_extraction_plan(config)
+    mismatches = 0
+    for name, html in pages:
+        expected = parse_html_details_bs4(html, name, config)
+        actual = plan.extract(html, name)
+        expected.pop('parsed_at', None)
+        actual.pop('parsed_at', None)
+        if expected != actual:
+            mismatches += 1
+            print(f"  mismatch on {name}:\n    bs4:  {expected}\n    plan: {actual}")
+
+    timings = {}
+    for label, func in (('bs4', lambda html, url: parse_html_details_bs4(html, url, config)), ('plan', plan.extract)):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for name, html in pages:
+                func(html, name)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[label] = best
+
+    print(f"pages: {len(pages)}, mismatches: {mismatches}")
+    for label, elapsed in timings.items():
+        print(f"{label:>5}: {elapsed / len(pages) * 1000:.3f} ms/page")
+    print(f"speedup: {timings['bs4'] / timings['plan']:.1f}x")
+
+if __name__ == "__main__":
+    # usage: python scripts/extraction.py <folder with saved ad pages>
+    from web_scrapping import KOLESA_ALMATY_CONFIG
+
+    if len(sys.argv) != 2:
+        print("usage: python scripts/extraction.py <folder with saved .html ad pages>")
+        sys.exit(1)
+    benchmark(sys.argv[1], KOLESA_ALMATY_CONFIG)
@@ -0,0 +1,81 @@
+import time
+import asyncio
+
+import aiohttp
+
+from rate_limit import is_throttle_status
+
+# browserless fetch backend for ad detail pages
+# a 200 response is always handed over: whether it is a captcha is decided after parsing, like on the selenium path
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "ru-RU,ru;q=0.9,en;q=0.8",
+    "Accept-Encoding": "gzip, deflate",
+}
+
+class HttpFetcher:
+    # fetches pages with one pooled keep-alive aiohttp session
+    # handle(url, html, error) is called on the event loop thread for every url,
+    # with html=None and a short error string when the request failed
+    # metrics (optional RunMetrics) receives the rate_limit_wait and http_get stage timings
+    def __init__(self, concurrency=8, timeout=15, rate_limiter=None, headers=None, metrics=None):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.headers = dict(DEFAULT_HEADERS, **(headers or {}))
+        self.metrics = metrics
+
+    async def fetch(self, session, url):
+        # returns (html, error) for a single url and reports the outcome to the rate limiter
+        if self.rate_limiter:
+            started = time.perf_counter()
+            await self.rate_limiter.wait_async(url)
+            if self.metrics:
+                self.metrics.observe('rate_limit_wait', time.perf_counter() - started)
+        html, error, throttled = None, None, False
+        started = time.perf_counter()
+        try:
+            async with session.get(url, allow_redirects=True) as response:
+                if response.status != 200:
+                    error = f"http {response.status}"
+                    throttled = is_throttle_status(response.status)
+                else:
+                    html = await response.text()
+        except asyncio.TimeoutError:
+            error, throttled = "timeout", True
+        except aiohttp.ClientError as e:
+            error, throttled = f"{type(e).__name__}: {e}", True
+        if self.metrics:
+            self.metrics.observe('http_get', time.perf_counter() - started, ok=error is None)
+        if self.rate_limiter:
+            if throttled:
+                self.rate_limiter.throttled(url, error)
+            elif error is None:
+                self.rate_limiter.success(url)
+        return html, error
+
+    async def _fetch_all(self, urls, handle):
+        connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=30, ttl_dns_cache=300)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        url_queue = asyncio.Queue()
+        for url in urls:
+            url_queue.put_nowait(url)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=self.headers,
+                                         auto_decompress=True) as session:
+            async def worker():
+                while True:
+                    try:
+                        url = url_queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    html, error = await self.fetch(session, url)
+                    handle(url, html, error)
+
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+    def fetch_all(self, urls, handle):
+        # fetches every url with up to `concurrency` requests in flight
+        asyncio.run(self._fetch_all(urls, handle))
@@ -1,137 +1,451 @@
 import os
+import re
 import time
-import random
-import pandas as pd
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service as ChromeService
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.options import Options as ChromeOptions
+import threading
+import numpy as np
 from selenium.webdriver.common.by import By
-from selenium.common.exceptions import NoSuchElementException, TimeoutException, WebDriverException # Added WebDriverException
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from urllib.parse import urljoin 
+from urllib.parse import urljoin, urlparse
 
-START_URL = "https://kolesa.kz/cars/almaty/"
-OUTPUT_CSV = "data/kolesa_almaty_found_urls.csv"
-MAX_PAGES = 1
+from crawl_state import CrawlState
+from driver_factory import ManagedDriver, resolve_driver_path
+from extraction import clean_text, compile_selector, element_text, extract_float, extract_numeric, parse_html
+from metrics import open_run_metrics
+from rate_limit import AdaptiveRateLimiter, looks_like_captcha
+
+BASE_URL = "https://kolesa.kz"
+# listing sections to crawl, each one is paged independently (?page=N)
+# narrower filters (brand + city) keep every shard under the site's page limit, e.g. "cars/toyota/almaty/"
+# shards should not overlap, otherwise a shard can stop early on ids another shard already found
+SHARDS = ["cars/almaty/"]
+STATE_DB = "data/kolesa_almaty_state.sqlite"  # shared with web_scrapping.py
+MAX_PAGES = 1  # per shard, None for no limit
+WORKERS = 1  # parallel chrome instances
+HEADLESS = True
+BLOCK_IMAGES = True  # images and web fonts are never parsed, skip downloading them
+DRIVER_RECYCLE_PAGES = 200  # restart a chrome instance after this many listing pages
+# adaptive pacing of listing requests shared by all workers (see rate_limit.AdaptiveRateLimiter)
+RATE_LIMIT = {"initial_rate": 0.2, "min_rate": 0.03, "max_rate": 1.0, "increase": 0.02}
+# incremental mode: a shard stops after this many consecutive pages that only contain already known ads
+# (listings should be sorted newest first for this to pay off); None disables it
+KNOWN_PAGES_TO_STOP = 3
+METRICS_DIR = "data/metrics"  # per-run stage timings (.jsonl) and summary (.json)
+# cards mode: also keep the fields shown on each listing card (title, price, year, mileage, city...)
+# in the crawl state, web_scrapping.py then only opens the ad pages of cards that miss a field
+CARDS_MODE = True
 
 AD_LINK_SELECTOR = "a.a-card__link"
-NEXT_PAGE_SELECTOR = "a.next_page" 
-AD_LIST_CONTAINER_SELECTOR = "div.a-list" 
-
-# setup
-chrome_options = ChromeOptions()
-chrome_options.add_argument("--disable-gpu")
-chrome_options.add_argument("--no-sandbox")
-# chrome_options.add_argument("--headless") # Run headless if you don't need to see the browser
-chrome_options.add_argument("--window-size=1280,800")
-user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36"
-chrome_options.add_argument(f'user-agent={user_agent}')
-chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-chrome_options.add_experimental_option('useAutomationExtension', False)
-
-driver = None
-all_urls = set()
-
-# ensure data directory exists
-os.makedirs(os.path.dirname(OUTPUT_CSV), exist_ok=True)
-
-# main script
-try:
-    print("Setting up WebDriver...")
-    service = ChromeService(ChromeDriverManager().install())
-    driver = webdriver.Chrome(service=service, options=chrome_options)
-    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-    print("WebDriver setup complete.")
+NEXT_PAGE_SELECTOR = "a.next_page"
+AD_LIST_CONTAINER_SELECTOR = "div.a-list"
 
-    current_url = START_URL
-    page_count = 0
+CARD_SELECTOR = "div.a-card"
+CARD_PRICE_SELECTOR = "span.a-card__price"
+CARD_DESCRIPTION_SELECTOR = "p.a-card__description"
+CARD_CITY_SELECTOR = 'span.a-card__param[data-test="region"]'
+# columns of web_scrapping.KOLESA_ALMATY_CONFIG a card can fill, values are written the way the ad page writes them
+# model is left out: the ad page shows it on its own ("2107"), the card only as part of the title
+CARD_COLUMNS = [
+    'brand', 'year', 'city', 'price', 'mileage',
+    'engine_volume_liters', 'body_style', 'color', 'transmission', 'drive_type',
+]
 
-    while current_url and (MAX_PAGES is None or page_count < MAX_PAGES):
-        page_count += 1
-        print(f"Scraping page {page_count}: {current_url}")
-        driver.get(current_url)
-        time.sleep(random.uniform(3, 6)) # Wait for page to potentially load dynamic content
+AD_PATH_PREFIX = "/a/show/"
+AD_ID_RE = re.compile(r"/a/show/(\d+)")
 
-        try:
-            # wait briefly for the ad list container to appear
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, AD_LIST_CONTAINER_SELECTOR))
-            )
-            time.sleep(random.uniform(1, 2)) # Extra small delay
-
-            # find all ad links on the current page
-            ad_elements = driver.find_elements(By.CSS_SELECTOR, AD_LINK_SELECTOR)
-            found_on_page = 0
-            for elem in ad_elements:
-                href = elem.get_attribute('href')
-                if href:
-                    # ensure the URL is absolute
-                    absolute_url = urljoin(START_URL, href) # Use urljoin here
-                    if absolute_url.startswith('https://kolesa.kz/a/show/'): # Basic check if it looks like an ad URL
-                       cleaned_url = absolute_url.split('?')[0] # Отсекаем все после '?'
-                       all_urls.add(cleaned_url)
-                       found_on_page += 1
-
-            print(f"  Found {found_on_page} ad links on this page. Total unique URLs: {len(all_urls)}")
-
-            # find and click the 'next page' button
-            try:
-                next_page_button = driver.find_element(By.CSS_SELECTOR, NEXT_PAGE_SELECTOR)
-                # check if the button is disabled (some sites disable the last 'next' button)
-                if next_page_button.is_enabled() and next_page_button.is_displayed():
-                     next_page_href = next_page_button.get_attribute('href')
-                     if next_page_href:
-                         current_url = urljoin(current_url, next_page_href) # Make sure next url is absolute
-                     else: # if href is missing or javascript based click needed
-                         print("  Next page button found, but href is missing. Attempting click...")
-                         next_page_button.click()
-                         time.sleep(random.uniform(2,4))
-                         current_url = driver.current_url
-                         if current_url == driver.current_url:
-                             print("  URL did not change after click, assuming end.")
-                             current_url = None
+# parts of a card description: "2015 г., Б/у седан, 2 л, бензин, КПП автомат, с пробегом 120 000 км, белый металлик, передний привод"
+_CARD_YEAR_RE = re.compile(r"^(\d{4}) г\.?$")
+_CARD_BODY_RE = re.compile(r"^(?:Б/у|Новый|Новая|Новое)\s+(.+)$")
+_CARD_ENGINE_RE = re.compile(r"^(\d+(?:[.,]\d+)?) л$")
+_CARD_TRANSMISSION_RE = re.compile(r"^КПП\s+(.+)$")
+_CARD_MILEAGE_RE = re.compile(r"^с пробегом\s+([\d\s]+)\s*км$")
+# colors as the ad page writes them (lowercase, optionally followed by "металлик")
+CARD_COLORS = (
+    'белый', 'черный', 'серый', 'серебристый', 'голубой', 'синий', 'жёлтый', 'желтый', 'золотистый',
+    'хамелеон', 'красный', 'бордовый', 'зеленый', 'коричневый', 'бежевый', 'фиолетовый', 'бирюзовый',
+    'бронза', 'оранжевый', 'вишня', 'сиреневый', 'розовый',
+)
+_CARD_COLOR_RE = re.compile(r"^(%s)(?:\s+металлик)?$" % '|'.join(CARD_COLORS))
+
+_AD_LINKS = compile_selector(AD_LINK_SELECTOR)
+_NEXT_PAGE = compile_selector(NEXT_PAGE_SELECTOR)
+_CARDS = compile_selector(CARD_SELECTOR)
+_CARD_LINK = compile_selector(AD_LINK_SELECTOR, scoped=True)
+_CARD_PRICE = compile_selector(CARD_PRICE_SELECTOR, scoped=True)
+_CARD_DESCRIPTION = compile_selector(CARD_DESCRIPTION_SELECTOR, scoped=True)
+_CARD_CITY = compile_selector(CARD_CITY_SELECTOR, scoped=True)
+
+def listing_page_url(shard, page):
+    # listing pages are addressable by number, page 1 has no page parameter
+    url = urljoin(BASE_URL + "/", shard)
+    if page == 1:
+        return url
+    return f"{url}{'&' if '?' in url else '?'}page={page}"
+
+def _ad_url(href, page_url, site):
+    # cleaned absolute ad url of a link, None for links to anything else
+    if not href:
+        return None
+    absolute_url = urlparse(urljoin(page_url, href))
+    # basic check if it looks like an ad URL on the same site
+    if absolute_url.netloc == site and absolute_url.path.startswith(AD_PATH_PREFIX):
+        return absolute_url._replace(query='', fragment='').geturl()  # drop everything after '?'
+    return None
+
+def _ad_urls(links, page_url):
+    # {link element: ad url} in page order, links to anything else are left out
+    site = urlparse(page_url).netloc
+    urls = {}
+    for elem in links:
+        url = _ad_url(elem.get('href'), page_url, site)
+        if url:
+            urls[elem] = url
+    return urls
+
+def extract_ad_urls(page_source, page_url):
+    # returns (cleaned absolute ad urls, whether the page links to a next page)
+    root = parse_html(page_source)
+    if root is None:
+        return [], False
+    return list(_ad_urls(_AD_LINKS(root), page_url).values()), bool(_NEXT_PAGE(root))
+
+def _capitalize(value):
+    # cards write "седан", "автомат", "передний привод", the ad page "Седан", "Автомат", "Передний привод"
+    return value[:1].upper() + value[1:]
+
+def parse_card_description(text):
+    # fields of a card description, parts that are not recognised (fuel, steering side) are left out
+    fields = {}
+    for part in (clean_text(part) for part in (text or '').split(',')):
+        if not part:
+            continue
+        if match := _CARD_YEAR_RE.match(part):
+            fields['year'] = int(match.group(1))
+        elif match := _CARD_BODY_RE.match(part):
+            fields['body_style'] = _capitalize(match.group(1))
+        elif match := _CARD_ENGINE_RE.match(part):
+            fields['engine_volume_liters'] = extract_float(match.group(1))
+        elif match := _CARD_TRANSMISSION_RE.match(part):
+            fields['transmission'] = _capitalize(match.group(1))
+        elif match := _CARD_MILEAGE_RE.match(part):
+            fields['mileage'] = extract_numeric(match.group(1))
+        elif _CARD_COLOR_RE.match(part.lower()):
+            fields['color'] = part.lower()
+        elif part.lower() == 'металлик' and fields.get('color'):
+            fields['color'] += ' металлик'
+        elif part.endswith('привод'):
+            fields['drive_type'] = _capitalize(part)
+    return fields
+
+def _card_text(xpath, card):
+    elements = xpath(card)
+    return clean_text(element_text(elements[0])) if elements else None
+
+def extract_ad_cards(page_source, page_url):
+    # cards mode: returns (ad urls, whether the page links to a next page, {ad url: card fields})
+    # card fields hold every CARD_COLUMNS key, None where the card does not show it
+    root = parse_html(page_source)
+    if root is None:
+        return [], False, {}
+    ad_urls = _ad_urls(_AD_LINKS(root), page_url)
+    cards = {}
+    for card in _CARDS(root):
+        links = _CARD_LINK(card)
+        url = ad_urls.get(links[0]) if links else None
+        if url is None:
+            continue
+        fields = dict.fromkeys(CARD_COLUMNS)
+        # the ad page's brand field holds the whole title ("ВАЗ (Lada) 2107"), cleaning.split_brand splits it
+        fields['brand'] = clean_text(element_text(links[0])) or None
+        fields['price'] = extract_numeric(_card_text(_CARD_PRICE, card))
+        fields['city'] = _card_text(_CARD_CITY, card) or None
+        fields.update(parse_card_description(_card_text(_CARD_DESCRIPTION, card)))
+        cards[url] = fields
+    return list(ad_urls.values()), bool(_NEXT_PAGE(root)), cards
+
+def card_missing_fields(fields):
+    # columns a card did not fill, what an ad page fetch would still have to add
+    return [col for col in CARD_COLUMNS if fields.get(col) in (None, '')]
+
+def ad_id(url):
+    # numeric id from /a/show/<id>, None for anything else
+    match = AD_ID_RE.search(url)
+    return int(match.group(1)) if match else None
+
+class KnownIdIndex:
+    # compact membership index over ad ids from earlier runs: one sorted int64 array
+    def __init__(self, ids):
+        self.ids = np.unique(np.fromiter((i for i in ids if i is not None), dtype=np.int64))
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(ad_id(url) for url in state.iter_urls())
+
+    def __len__(self):
+        return len(self.ids)
 
+    def contains(self, ids):
+        # boolean array, True where the id is known
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(self.ids):
+            return np.zeros(len(ids), dtype=bool)
+        positions = np.searchsorted(self.ids, ids).clip(max=len(self.ids) - 1)
+        return self.ids[positions] == ids
+
+class ShardCursor:
+    # hands out page numbers of one listing section and remembers where it ended
+    def __init__(self, shard, max_pages=None):
+        self.shard = shard
+        self.max_pages = max_pages
+        self.next_page = 1
+        self.last_page = None  # first page known to be the end of the shard
+        self.pages_done = 0
+        self.known_pages = set()  # pages on which every ad was already known
+        self.retry_pages = []  # pages lost to a browser crash, handed out once more
+        self.retried = set()
+
+    def claim(self):
+        if self.retry_pages:
+            return self.retry_pages.pop()
+        if self.max_pages is not None and self.next_page > self.max_pages:
+            return None
+        if self.last_page is not None and self.next_page > self.last_page:
+            return None
+        page = self.next_page
+        self.next_page += 1
+        return page
+
+    def end_at(self, page):
+        self.last_page = page if self.last_page is None else min(self.last_page, page)
+
+class DiscoveryEngine:
+    # runs listing pages of all shards across several workers
+    # ad ids are de-duplicated through one shared set, a shard stops at the first page
+    # that has no next page link or yields no ad id that was not seen before
+    # with a known_index it also stops after known_pages_to_stop consecutive pages of known ads
+    def __init__(self, shards, max_pages=None, state=None, known_index=None, known_pages_to_stop=None):
+        self.cursors = [ShardCursor(shard, max_pages) for shard in shards]
+        self.state = state
+        self.known_index = known_index
+        self.known_pages_to_stop = known_pages_to_stop
+        self.seen_ids = set()
+        self.all_urls = set()
+        self.new_in_state = 0
+        self._lock = threading.Lock()
+        self._turn = 0
+
+    def next_job(self):
+        # round-robin over shards that still have pages to claim; None when everything is claimed
+        with self._lock:
+            for offset in range(len(self.cursors)):
+                cursor = self.cursors[(self._turn + offset) % len(self.cursors)]
+                page = cursor.claim()
+                if page is not None:
+                    self._turn = (self._turn + offset + 1) % len(self.cursors)
+                    return cursor, page
+            return None
+
+    def record(self, cursor, page, ad_urls, has_next_page, cards=None):
+        # merges the urls of one page, cards (cards mode) are stored for the urls that are new in this run
+        # returns (urls not seen earlier in this run, urls that were not in the crawl state yet)
+        with self._lock:
+            new_urls = []
+            for url in ad_urls:
+                key = ad_id(url)
+                if key not in self.seen_ids:
+                    self.seen_ids.add(key)
+                    new_urls.append(url)
+            self.all_urls.update(new_urls)
+            cursor.pages_done += 1
+            if not new_urls or not has_next_page:
+                cursor.end_at(page)
+            elif self._only_known(ad_urls):
+                self._record_known_page(cursor, page)
+        added = 0
+        if new_urls and self.state is not None:
+            added = self.state.upsert_urls(new_urls)
+            if cards:
+                self.state.save_cards(
+                    (url, cards[url], card_missing_fields(cards[url])) for url in new_urls if url in cards
+                )
+            with self._lock:
+                self.new_in_state += added
+        return len(new_urls), added
+
+    def _only_known(self, ad_urls):
+        if self.known_index is None or not self.known_pages_to_stop:
+            return False
+        ids = [ad_id(url) for url in ad_urls]
+        return bool(ids) and bool(self.known_index.contains(ids).all())
+
+    def _record_known_page(self, cursor, page):
+        # pages finish out of order, so look for any run of k consecutive known pages around this one
+        k = self.known_pages_to_stop
+        cursor.known_pages.add(page)
+        for start in range(max(1, page - k + 1), page + 1):
+            if all(p in cursor.known_pages for p in range(start, start + k)):
+                cursor.end_at(start + k - 1)
+                break
+
+    def end_shard(self, cursor, page):
+        with self._lock:
+            cursor.end_at(page)
+
+    def retry_page(self, cursor, page):
+        # gives a page one more try on a fresh browser, ends the shard if it already had one
+        with self._lock:
+            if page in cursor.retried:
+                cursor.end_at(page)
+            else:
+                cursor.retried.add(page)
+                cursor.retry_pages.append(page)
+
+def _discard_driver(name, managed, metrics, page_url, error):
+    print(f"  WebDriverException on page {page_url}: {error}")
+    metrics.failure("WebDriverException", url=page_url)
+    metrics.count('driver_restarts')
+    print(f"  [{name}] Discarding the possibly dead WebDriver session.")
+    managed.discard()
+
+def _discovery_worker(engine, rate_limiter, metrics, stop_event):
+    name = threading.current_thread().name
+    managed = ManagedDriver(headless=HEADLESS, block_images=BLOCK_IMAGES, max_pages=DRIVER_RECYCLE_PAGES, name=name)
+    try:
+        with metrics.stage('driver_start'):
+            managed.driver  # start up front so a broken setup is reported before claiming pages
+    except Exception as e:
+        print(f"[{name}] Could not start WebDriver: {e}")
+        return
+    try:
+        while not stop_event.is_set():
+            job = engine.next_job()
+            if job is None:
+                break
+            cursor, page = job
+            page_url = listing_page_url(cursor.shard, page)
+            print(f"[{name}] Scraping {cursor.shard} page {page}: {page_url}")
+            try:
+                driver = managed.driver
+                with metrics.stage('rate_limit_wait'):
+                    rate_limiter.wait(page_url)
+                with metrics.stage('driver_get'):
+                    driver.get(page_url)
+                # wait briefly for the ad list container to appear
+                with metrics.stage('wait_for_list'):
+                    WebDriverWait(driver, 10).until(
+                        EC.presence_of_element_located((By.CSS_SELECTOR, AD_LIST_CONTAINER_SELECTOR))
+                    )
+                rate_limiter.success(page_url)
+                with metrics.stage('page_source'):
+                    page_source = driver.page_source
+                cards = None
+                with metrics.stage('extract_links'):
+                    if CARDS_MODE:
+                        ad_urls, has_next_page, cards = extract_ad_cards(page_source, page_url)
+                    else:
+                        ad_urls, has_next_page = extract_ad_urls(page_source, page_url)
+                with metrics.stage('state_upsert'):
+                    found, added = engine.record(cursor, page, ad_urls, has_next_page, cards)
+                metrics.count('pages')
+                metrics.count('new_urls', added)
+                if cards is not None:
+                    metrics.count('cards', len(cards))
+                print(f"  [{name}] {cursor.shard} page {page}: {len(ad_urls)} ad links, {found} unique, {added} new"
+                      f"{f', {len(cards)} cards' if cards is not None else ''}. Total unique URLs: {len(engine.all_urls)}")
+                if cursor.last_page == page:
+                    print(f"  [{name}] Reached the end of {cursor.shard} at page {page}.")
+                managed.page_done()
+            except TimeoutException:
+                try:
+                    is_captcha = looks_like_captcha(driver.page_source)
+                except WebDriverException as e_wd:  # the session died while we looked at the page
+                    engine.retry_page(cursor, page)
+                    _discard_driver(name, managed, metrics, page_url, e_wd)
+                    continue
+                metrics.failure("TimeoutException", url=page_url)
+                if is_captcha:
+                    print(f"  Captcha instead of listing page {page_url}. Backing off and retrying once.")
+                    rate_limiter.throttled(page_url, "captcha")
+                    engine.retry_page(cursor, page)
                 else:
-                    print("  'Next page' button found but is disabled or not visible. Reached the end.")
-                    current_url = None # Stop the loop
-
-            except NoSuchElementException:
-                print("  'Next page' button not found. Reached the end.")
-                current_url = None # Stop the loop
-
-        except TimeoutException:
-            print(f"  Timeout waiting for ad list container '{AD_LIST_CONTAINER_SELECTOR}' on page {current_url}. Skipping page.")
-            # decide whether to stop or try the next page if possible (here we stop)
-            current_url = None
-        except Exception as e:
-            print(f"  An error occurred while processing page {current_url}: {e}")
-            # decide whether to stop or continue
-            # current_url = None # Option: Stop on error
-            # option: try to find next page anyway? Risky. Best to stop here.
-            current_url = None
-
-
-except WebDriverException as e_wd:
-    print(f"WebDriverException setting up or using WebDriver: {e_wd}")
-except Exception as e:
-    print(f"An unexpected error occurred: {e}")
-    import traceback # import traceback to print stack trace
-    traceback.print_exc() # print stack trace for debugging
-finally:
-    if driver:
-        print("Closing WebDriver.")
-        driver.quit()
-
-# save the collected URLs to a CSV file
-if all_urls:
-    print(f"\nFound a total of {len(all_urls)} unique URLs.")
-    df_urls = pd.DataFrame(list(all_urls), columns=['url'])
-    df_urls.to_csv(OUTPUT_CSV, index=False, encoding='utf-8')
-    print(f"URLs saved to {OUTPUT_CSV}")
-else:
-    print("No URLs were collected.")
-
-print("Script finished.")
\ No newline at end of file
+                    print(f"  Timeout waiting for ad list container '{AD_LIST_CONTAINER_SELECTOR}' on page {page_url}. Retrying once.")
+                    rate_limiter.throttled(page_url, "timeout")
+                    engine.retry_page(cursor, page)
+                managed.page_done()
+            except WebDriverException as e_wd:
+                engine.retry_page(cursor, page)
+                _discard_driver(name, managed, metrics, page_url, e_wd)
+            except Exception as e:
+                print(f"  An error occurred while processing page {page_url}: {e}")
+                metrics.failure(type(e).__name__, url=page_url)
+                engine.end_shard(cursor, page)
+    finally:
+        print(f"[{name}] Closing WebDriver.")
+        managed.quit()
+
+def discover(shards=SHARDS, max_pages=MAX_PAGES, workers=WORKERS, state_db=STATE_DB,
+             rate_limit=RATE_LIMIT, known_pages_to_stop=KNOWN_PAGES_TO_STOP, metrics_dir=METRICS_DIR):
+    # crawls listing pages of every shard with `workers` parallel drivers
+    # and upserts every new ad url into the crawl state as soon as its page is done
+    os.makedirs(os.path.dirname(state_db), exist_ok=True)
+    print("Setting up WebDriver...")
+    resolve_driver_path()  # resolved once here, workers reuse the cached path
+    rate_limiter = AdaptiveRateLimiter(**rate_limit)
+    stop_event = threading.Event()
+    run_name = os.path.splitext(os.path.basename(state_db))[0].replace('_state', '') + "_discovery"
+    metrics, summary_path = open_run_metrics(metrics_dir, run_name)
+
+    with CrawlState(state_db) as state:
+        known_index = None
+        if known_pages_to_stop:
+            known_index = KnownIdIndex.from_state(state)
+            print(f"Incremental mode: {len(known_index)} known ads, a shard stops after {known_pages_to_stop} pages of known ads.")
+        engine = DiscoveryEngine(shards, max_pages=max_pages, state=state,
+                                 known_index=known_index, known_pages_to_stop=known_pages_to_stop)
+        threads = [
+            threading.Thread(
+                target=_discovery_worker,
+                name=f"discovery-{n + 1}",
+                args=(engine, rate_limiter, metrics, stop_event),
+                daemon=True,
+            )
+            for n in range(max(1, workers))
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=0.5)
+        except KeyboardInterrupt:
+            print("\nStopping workers, waiting for in-flight pages...")
+            stop_event.set()
+            for thread in threads:
+                thread.join()
+            raise
+        finally:
+            print(f"\nFound a total of {len(engine.all_urls)} unique URLs.")
+            for cursor in engine.cursors:
+                print(f"  {cursor.shard}: {cursor.pages_done} pages")
+            print(f"Rate limiter: {rate_limiter.snapshot()}")
+            print(f"{engine.new_in_state} new URLs added to {state_db} as pending. Crawl state: {state.counts()}")
+            metrics.print_summary()
+            metrics.write_summary(summary_path)
+            metrics.close()
+            print(f"Run metrics saved to: {summary_path}")
+    return engine.all_urls
+
+if __name__ == "__main__":
+    start_time = time.time()
+    try:
+        discover()
+    except KeyboardInterrupt:
+        print("\nScript interrupted by user (ctrl+c).")
+    except WebDriverException as e_wd:
+        print(f"WebDriverException setting up or using WebDriver: {e_wd}")
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+        import traceback  # import traceback to print stack trace
+        traceback.print_exc()  # print stack trace for debugging
+    print(f"Script finished in {time.time() - start_time:.2f} seconds.")
@@ -0,0 +1,326 @@
+import os
+import json
+import argparse
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from cleaning import read_chunks
+
+# precomputed market aggregates over the cleaned data, for the charts of cleaning-analysis.ipynb
+# one cell per (brand, model, year, body_style, drive_type) holds the count, sums, sums of squares,
+# cross products, min and max of every measure, plus a quantile sketch per measure:
+#   - means, standard deviations and the correlation matrix come from the sums
+#   - medians, quartiles and percentiles come from the sketches, with a relative error of at most alpha
+# every part merges by addition, so update() only folds rows whose url is not in the cube yet
+# (late rows with an older parsed_at included) and any question over any group of cells is answered from the cube alone
+
+KEYS = ['brand', 'model', 'year', 'body_style', 'drive_type']
+MEASURES = ['price', 'mileage', 'engine_volume_liters']
+PAIRS = [(a, b) for i, a in enumerate(MEASURES) for b in MEASURES[i + 1:]]
+
+DEFAULT_ALPHA = 0.01
+ZERO_BUCKET = np.iinfo(np.int32).min  # sketch bucket of zero (new cars' mileage, electric cars' engine volume)
+
+class QuantileSketch:
+    # log-bucketed histogram (the ddsketch idea): a value x > 0 goes to bucket ceil(log(x) / log(gamma)),
+    # gamma = (1 + alpha) / (1 - alpha); every value in a bucket is within alpha of the bucket's value
+    # sketches of different cells merge by adding the counts of equal buckets
+    def __init__(self, alpha=DEFAULT_ALPHA):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = np.log(self.gamma)
+
+    def buckets(self, values):
+        values = np.asarray(values, dtype='float64')
+        positive = values > 0
+        buckets = np.full(len(values), ZERO_BUCKET, dtype=np.int32)
+        buckets[positive] = np.ceil(np.log(values[positive]) / self._log_gamma)
+        return buckets
+
+    def values(self, buckets):
+        # value each bucket stands for
+        buckets = np.asarray(buckets)
+        values = 2 * self.gamma ** buckets.astype('float64') / (self.gamma + 1)
+        return np.where(buckets == ZERO_BUCKET, 0.0, values)
+
+    def quantiles(self, buckets, counts, q):
+        # quantiles q (0..1) of one sorted bucket histogram, like Series.quantile(interpolation='lower')
+        cumulative = np.cumsum(counts)
+        ranks = np.asarray(q, dtype='float64') * (cumulative[-1] - 1)
+        positions = np.searchsorted(cumulative, ranks, side='right')
+        return self.values(np.asarray(buckets)[positions])
+
+def _cell_aggregates(df):
+    # sums, sums of squares, cross products, min and max of every measure per cell
+    values = {'n': np.ones(len(df), dtype='int64')}
+    for m in MEASURES:
+        values[f'{m}_sum'] = df[m]
+        values[f'{m}_sumsq'] = df[m] ** 2
+        values[f'{m}_min'] = df[m]
+        values[f'{m}_max'] = df[m]
+    for a, b in PAIRS:
+        values[f'{a}*{b}'] = df[a] * df[b]
+    frame = pd.DataFrame(values, index=df.index)
+    frame[KEYS] = df[KEYS]
+    return frame.groupby(KEYS, dropna=False, observed=True).agg(_AGGREGATIONS).reset_index()
+
+def _url_hashes(urls):
+    # 64-bit hashes of the urls, what the cube remembers of every row it has folded
+    return pd.util.hash_pandas_object(urls.astype(str), index=False).to_numpy()
+
+def _aggregation(column):
+    if column.endswith('_min'):
+        return 'min'
+    if column.endswith('_max'):
+        return 'max'
+    return 'sum'
+
+_CELL_COLUMNS = ['n'] + [f'{m}_{part}' for m in MEASURES for part in ('sum', 'sumsq', 'min', 'max')] + [f'{a}*{b}' for a, b in PAIRS]
+_AGGREGATIONS = {column: _aggregation(column) for column in _CELL_COLUMNS}
+
+class MarketCube:
+    # path: directory with cells.parquet, sketches.parquet, folded.parquet and meta.json; created on the first save()
+    def __init__(self, path, alpha=DEFAULT_ALPHA):
+        self.path = path
+        self.reset(alpha)
+        if os.path.exists(os.path.join(path, 'meta.json')):
+            with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+                self.meta.update(json.load(f))
+            self.cells = pd.read_parquet(os.path.join(path, 'cells.parquet'))
+            self.sketches = pd.read_parquet(os.path.join(path, 'sketches.parquet'))
+            self.sketch = QuantileSketch(self.meta['alpha'])
+            folded_path = os.path.join(path, 'folded.parquet')
+            # cubes from before folded.parquet existed only kept a parsed_at watermark and have to be rebuilt
+            self.folded = pd.read_parquet(folded_path)['url_hash'].to_numpy() if os.path.exists(folded_path) else None
+
+    def reset(self, alpha=DEFAULT_ALPHA):
+        # empties the cube, the next update() reads the whole source; save() replaces the files
+        self.meta = {'alpha': alpha, 'latest_parsed_at': None, 'rows': 0, 'skipped': 0, 'source': None, 'updated_at': None}
+        self.cells = pd.DataFrame(columns=KEYS + _CELL_COLUMNS)
+        self.sketches = pd.DataFrame(columns=KEYS + ['measure', 'bucket', 'count'])
+        self.folded = np.array([], dtype=np.uint64)  # sorted url hashes of every row read so far
+        self.sketch = QuantileSketch(alpha)
+
+    # building
+
+    def update(self, source, chunksize=500_000):
+        # folds the rows of a cleaned csv file / dataset whose url is not in the cube yet
+        # every url counts once, a second row of the same ad (full re-scrape) is left out like in a full build
+        # returns the number of rows added
+        if self.folded is None:
+            raise ValueError(f"{self.path} was built before folded urls were tracked, run 'update --rebuild'")
+        cells, sketches = [self.cells], [self.sketches]
+        rows = skipped = 0
+        folded = self.folded
+        latest = pd.Timestamp(self.meta['latest_parsed_at']) if self.meta.get('latest_parsed_at') else None
+        for chunk in read_chunks(source, chunksize):
+            hashes = _url_hashes(chunk['url'])
+            new = ~np.isin(hashes, folded) & ~pd.Series(hashes).duplicated().to_numpy()
+            if not new.any():
+                continue
+            chunk = chunk[new]
+            folded = np.union1d(folded, hashes[new])
+            chunk = chunk.assign(parsed_at=pd.to_datetime(chunk['parsed_at'], errors='coerce'))
+            for m in MEASURES:
+                chunk[m] = pd.to_numeric(chunk[m], errors='coerce').astype('float64')
+            complete = chunk.dropna(subset=MEASURES)
+            skipped += len(chunk) - len(complete)
+            if complete.empty:
+                continue
+            cells.append(_cell_aggregates(complete))
+            sketches.append(self._sketch_counts(complete))
+            rows += len(complete)
+            newest = complete['parsed_at'].max()
+            if pd.notna(newest) and (latest is None or newest > latest):
+                latest = newest
+        if rows:
+            self.cells = self._merge(cells, _AGGREGATIONS)
+            self.sketches = self._merge(sketches, {'count': 'sum'}, ['measure', 'bucket'])
+        self.folded = folded
+        self.meta.update({
+            'latest_parsed_at': latest.isoformat() if latest is not None else None,
+            'rows': self.meta['rows'] + rows,
+            'skipped': self.meta['skipped'] + skipped,
+            'source': source,
+            'updated_at': datetime.now().isoformat(timespec='seconds'),
+        })
+        self.meta.pop('watermark', None)
+        return rows
+
+    def _sketch_counts(self, df):
+        parts = []
+        for m in MEASURES:
+            part = df[KEYS].assign(measure=m, bucket=self.sketch.buckets(df[m].to_numpy()), count=1)
+            parts.append(part.groupby(KEYS + ['measure', 'bucket'], dropna=False, observed=True)['count'].sum().reset_index())
+        return pd.concat(parts, ignore_index=True)
+
+    @staticmethod
+    def _merge(frames, aggregations, extra_keys=()):
+        frames = [frame for frame in frames if not frame.empty]
+        merged = pd.concat(frames, ignore_index=True)
+        for key in ['brand', 'model', 'body_style', 'drive_type']:
+            merged[key] = merged[key].astype(object)
+        merged['year'] = pd.to_numeric(merged['year'])
+        return merged.groupby(KEYS + list(extra_keys), dropna=False).agg(aggregations).reset_index()
+
+    def save(self):
+        # each file is replaced in one step, readers never see a half-written cube
+        os.makedirs(self.path, exist_ok=True)
+        folded = pd.DataFrame({'url_hash': self.folded})
+        for name, frame in (('cells', self.cells), ('sketches', self.sketches), ('folded', folded)):
+            frame.to_parquet(os.path.join(self.path, f'{name}.parquet.tmp'), index=False)
+            os.replace(os.path.join(self.path, f'{name}.parquet.tmp'), os.path.join(self.path, f'{name}.parquet'))
+        with open(os.path.join(self.path, 'meta.json.tmp'), 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, ensure_ascii=False, indent=2)
+        os.replace(os.path.join(self.path, 'meta.json.tmp'), os.path.join(self.path, 'meta.json'))
+
+    # queries; `by` is a key column or a list of them, **equals filters cells (brand='Toyota', year=[2019, 2020])
+
+    @staticmethod
+    def _select(frame, equals):
+        for column, value in equals.items():
+            if isinstance(value, (list, tuple, set)):
+                frame = frame[frame[column].isin(list(value))]
+            else:
+                frame = frame[frame[column] == value]
+        return frame
+
+    @staticmethod
+    def _by(by):
+        return [by] if isinstance(by, str) else list(by or [])
+
+    def stats(self, measure='price', by=None, **equals):
+        # count, mean, std (sample), min and max of a measure per group, like df.groupby(by)[measure].describe()
+        by = self._by(by)
+        cells = self._select(self.cells, equals)
+        columns = ['n', f'{measure}_sum', f'{measure}_sumsq', f'{measure}_min', f'{measure}_max']
+        if by:
+            totals = cells.groupby(by, dropna=False)[columns].agg({c: _aggregation(c) for c in columns})
+        else:
+            totals = cells[columns].agg({c: _aggregation(c) for c in columns}).to_frame().T
+        n = totals['n'].astype('float64')
+        mean = totals[f'{measure}_sum'] / n
+        variance = (totals[f'{measure}_sumsq'] - n * mean ** 2) / (n - 1)
+        return pd.DataFrame({
+            'count': totals['n'].astype('int64'),
+            'mean': mean,
+            'std': np.sqrt(variance.clip(lower=0)),
+            'min': totals[f'{measure}_min'],
+            'max': totals[f'{measure}_max'],
+        })
+
+    def quantiles(self, q, measure='price', by=None, **equals):
+        # quantiles from the merged sketches of every group, clamped to the group's exact min and max
+        # q: a float or a list; returns a float, a Series (per q) or a DataFrame (groups x q)
+        by = self._by(by)
+        qs = [q] if np.isscalar(q) else list(q)
+        sketches = self._select(self.sketches[self.sketches['measure'] == measure], equals)
+        merged = sketches.groupby(by + ['bucket'], dropna=False)['count'].sum().reset_index()
+        limits = self.stats(measure, by or None, **equals)
+        rows = {}
+        for group, part in (merged.groupby(by, dropna=False, sort=True) if by else [((), merged)]):
+            label = group[0] if len(by) == 1 else group
+            part = part.sort_values('bucket')
+            values = self.sketch.quantiles(part['bucket'].to_numpy(), part['count'].to_numpy(), qs)
+            low, high = limits.loc[label if by else 0, ['min', 'max']]
+            rows[label] = np.clip(values, low, high)
+        if not by:
+            result = pd.Series(rows[()], index=qs, name=measure)
+            return float(result.iloc[0]) if np.isscalar(q) else result
+        result = pd.DataFrame.from_dict(rows, orient='index', columns=qs)
+        result.index = pd.MultiIndex.from_tuples(result.index, names=by) if len(by) > 1 else result.index.rename(by[0])
+        return result
+
+    def boxplot_stats(self, measure='price', by='brand', whis=1.5, **equals):
+        # one dict per group in the format of matplotlib's Axes.bxp: ax.bxp(cube.boxplot_stats('price', 'brand'))
+        # whiskers at the last sketch values inside whis * IQR, like sns.boxplot; fliers are not kept
+        by_columns = self._by(by)
+        box = self.quantiles([0.25, 0.5, 0.75], measure, by, **equals)
+        limits = self.stats(measure, by, **equals)
+        sketches = self._select(self.sketches[self.sketches['measure'] == measure], equals)
+        buckets = sketches[sketches['count'] > 0].groupby(by_columns, dropna=False)['bucket'].unique()
+        stats = []
+        for label, (q1, med, q3) in box.iterrows():
+            iqr = q3 - q1
+            low, high = limits.loc[label, ['min', 'max']]
+            values = np.clip(self.sketch.values(buckets.loc[label]), low, high)
+            # the exact min / max when they are inside the fences, else the outermost sketch value inside them
+            fence_low, fence_high = q1 - whis * iqr, q3 + whis * iqr
+            inside = values[(values >= fence_low) & (values <= fence_high)]
+            whislo = low if low >= fence_low else min(inside.min(), q1) if len(inside) else q1
+            whishi = high if high <= fence_high else max(inside.max(), q3) if len(inside) else q3
+            stats.append({
+                'label': label, 'q1': q1, 'med': med, 'q3': q3,
+                'whislo': whislo, 'whishi': whishi,
+                'mean': limits.loc[label, 'mean'], 'fliers': [],
+            })
+        return stats
+
+    def histogram(self, measure='price', bins=30, **equals):
+        # (counts, edges) with equal-width bins over the measure's range, like np.histogram; for sns.histplot-style charts
+        sketches = self._select(self.sketches[self.sketches['measure'] == measure], equals)
+        merged = sketches.groupby('bucket')['count'].sum()
+        limits = self.stats(measure, **equals).iloc[0]
+        values = np.clip(self.sketch.values(merged.index.to_numpy()), limits['min'], limits['max'])
+        return np.histogram(values, bins=bins, range=(limits['min'], limits['max']), weights=merged.to_numpy())
+
+    def correlation(self, **equals):
+        # pearson correlation of year and the measures, like df[['year', *MEASURES]].corr()
+        cells = self._select(self.cells, equals)
+        n = cells['n'].sum()
+        year = cells['year'].astype('float64')
+        sums = {'year': (year * cells['n']).sum()}
+        squares = {'year': (year ** 2 * cells['n']).sum()}
+        products = {}
+        for m in MEASURES:
+            sums[m] = cells[f'{m}_sum'].sum()
+            squares[m] = cells[f'{m}_sumsq'].sum()
+            products[('year', m)] = (year * cells[f'{m}_sum']).sum()
+        for a, b in PAIRS:
+            products[(a, b)] = cells[f'{a}*{b}'].sum()
+        columns = ['year'] + MEASURES
+        matrix = pd.DataFrame(np.eye(len(columns)), index=columns, columns=columns)
+        for (a, b), product in products.items():
+            covariance = product - sums[a] * sums[b] / n
+            spread = np.sqrt((squares[a] - sums[a] ** 2 / n) * (squares[b] - sums[b] ** 2 / n))
+            matrix.loc[a, b] = matrix.loc[b, a] = covariance / spread if spread else np.nan
+        return matrix
+
+if __name__ == "__main__":
+    # usage:
+    #   python scripts/market_cube.py update [cleaned data]       folds the rows of ads not in the cube yet
+    #   python scripts/market_cube.py update --rebuild             starts over from the whole file
+    #   python scripts/market_cube.py stats --by brand             price count/mean/std/min/max per brand
+    #   python scripts/market_cube.py quantiles 0.01 0.5 0.99 --measure mileage
+    #   python scripts/market_cube.py corr
+    parser = argparse.ArgumentParser(description="precomputed aggregates of the cleaned kolesa.kz data")
+    parser.add_argument('command', choices=['update', 'stats', 'quantiles', 'corr'])
+    parser.add_argument('args', nargs='*', help="update: cleaned csv / dataset; quantiles: q values")
+    parser.add_argument('--cube', default='data/kolesa_almaty_cube')
+    parser.add_argument('--rebuild', action='store_true')
+    parser.add_argument('--alpha', type=float, default=DEFAULT_ALPHA, help="relative error of the quantiles (new cubes only)")
+    parser.add_argument('--measure', default='price', choices=MEASURES)
+    parser.add_argument('--by', nargs='*', default=None, choices=KEYS)
+    args = parser.parse_args()
+
+    if args.command == 'update':
+        cube = MarketCube(args.cube, alpha=args.alpha)
+        source = args.args[0] if args.args else (cube.meta['source'] or 'data/kolesa_almaty_cleaned.csv')
+        if args.rebuild:
+            cube.reset(args.alpha)
+        start_time = datetime.now()
+        rows = cube.update(source)
+        cube.save()
+        print(f"added {rows} rows from {source} in {(datetime.now() - start_time).total_seconds():.1f}s: "
+              f"{cube.meta['rows']} rows in {len(cube.cells)} cells, data up to {cube.meta['latest_parsed_at']}")
+    else:
+        cube = MarketCube(args.cube)
+        with pd.option_context('display.max_rows', 200, 'display.width', 160, 'display.float_format', '{:,.2f}'.format):
+            if args.command == 'stats':
+                print(cube.stats(args.measure, args.by))
+            elif args.command == 'quantiles':
+                print(cube.quantiles([float(q) for q in args.args] or [0.25, 0.5, 0.75], args.measure, args.by))
+            else:
+                print(cube.correlation())
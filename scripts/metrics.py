@@ -0,0 +1,165 @@
+import os
+import json
+import math
+import bisect
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+# per-stage timing, counters and failure counts for one scraper run
+# every measurement is appended to a json-lines log, summary() / write_summary() give the end-of-run view
+
+# histogram bucket upper bounds in seconds: 1 ms .. ~2 min, 4 buckets per power of ten
+_BUCKETS = [10 ** (exp / 4) for exp in range(-12, 9)]
+
+class Histogram:
+    # fixed log-scale buckets; percentiles are bucket upper bounds, exact min/max/mean are kept aside
+    def __init__(self):
+        self.buckets = [0] * (len(_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.buckets[bisect.bisect_left(_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return min(_BUCKETS[i], self.max) if i < len(_BUCKETS) else self.max
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'total_s': round(self.total, 3),
+            'mean_s': round(self.total / self.count, 4),
+            'min_s': round(self.min, 4),
+            'p50_s': round(self.percentile(0.5), 4),
+            'p90_s': round(self.percentile(0.9), 4),
+            'p99_s': round(self.percentile(0.99), 4),
+            'max_s': round(self.max, 4),
+        }
+
+class RunMetrics:
+    # thread-safe collector for one run
+    #   with metrics.stage('driver_get'): ...   -> latency histogram per stage
+    #   metrics.count('parsed')                 -> counters, reported per minute in the summary
+    #   metrics.failure('TimeoutException')     -> failures by exception type
+    # log_path: json-lines file that gets one line per stage / failure / event (None = no log)
+    def __init__(self, run_name, log_path=None):
+        self.run_name = run_name
+        self.started_at = datetime.now()
+        self._start = time.monotonic()
+        self.stages = {}
+        self.counters = {}
+        self.failures = {}
+        self._lock = threading.Lock()
+        self._log = None
+        if log_path:
+            directory = os.path.dirname(log_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._log = open(log_path, 'a', encoding='utf-8')
+        self.log_path = log_path
+
+    def _emit(self, record):
+        if self._log is None:
+            return
+        record = {'ts': datetime.now().isoformat(timespec='milliseconds'), 'run': self.run_name, **record}
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            if self._log is not None:
+                self._log.write(line + '\n')
+
+    @contextmanager
+    def stage(self, name, **fields):
+        # times the block; the duration is recorded even if it raises
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.observe(name, time.perf_counter() - start, ok=ok, **fields)
+
+    def observe(self, name, seconds, ok=True, **fields):
+        with self._lock:
+            histogram = self.stages.get(name)
+            if histogram is None:
+                histogram = self.stages[name] = Histogram()
+            histogram.add(seconds)
+        self._emit({'event': 'stage', 'stage': name, 'seconds': round(seconds, 6), 'ok': ok, **fields})
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def failure(self, kind, **fields):
+        # kind is usually type(exc).__name__
+        with self._lock:
+            self.failures[kind] = self.failures.get(kind, 0) + 1
+        self._emit({'event': 'failure', 'kind': kind, **fields})
+
+    def event(self, name, **fields):
+        self._emit({'event': name, **fields})
+
+    def summary(self):
+        elapsed = time.monotonic() - self._start
+        minutes = elapsed / 60 if elapsed > 0 else None
+        with self._lock:
+            return {
+                'run': self.run_name,
+                'started_at': self.started_at.isoformat(timespec='seconds'),
+                'finished_at': datetime.now().isoformat(timespec='seconds'),
+                'elapsed_s': round(elapsed, 3),
+                'counters': dict(self.counters),
+                'per_minute': {name: round(n / minutes, 2) for name, n in self.counters.items()} if minutes else {},
+                'failures': dict(self.failures),
+                'stages': {name: histogram.summary() for name, histogram in self.stages.items()},
+            }
+
+    def write_summary(self, path):
+        summary = self.summary()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        return summary
+
+    def print_summary(self):
+        summary = self.summary()
+        print(f"--- timings ({summary['elapsed_s']:.1f}s) ---")
+        for name, stats in summary['stages'].items():
+            if stats['count']:
+                print(f"  {name:<20} n={stats['count']:<6} mean={stats['mean_s']:.3f}s p90={stats['p90_s']:.3f}s total={stats['total_s']:.1f}s")
+        for name, rate in summary['per_minute'].items():
+            print(f"  {name}: {rate}/min")
+        if summary['failures']:
+            print(f"  failures: {summary['failures']}")
+
+    def close(self):
+        if self._log is not None:
+            with self._lock:
+                self._log.close()
+                self._log = None
+
+def open_run_metrics(metrics_dir, run_name):
+    # metrics for a new run: <metrics_dir>/<run_name>_<timestamp>.jsonl plus the summary path next to it
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    base = os.path.join(metrics_dir, f"{run_name}_{stamp}")
+    return RunMetrics(run_name, log_path=f"{base}.jsonl"), f"{base}_summary.json"
@@ -0,0 +1,267 @@
+import os
+import sys
+import mmap
+import sqlite3
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import zstandard
+except ImportError:  # reported when an archive is opened
+    zstandard = None
+
+from parse_pool import extract_page
+
+# raw html archive of fetched ad pages, so selectors can change without a re-crawl
+# layout of an archive directory:
+#   segment-00001.zst, ...  append-only files of independently compressed zstd frames
+#   index.sqlite            blobs: sha256 of the page -> (segment, offset, length)
+#                           pages: url -> sha256 and fetch time of its latest copy
+# identical pages are stored once (content-addressed), a url that is fetched again points to its newest copy
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    segment INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    fetched_at TEXT NOT NULL
+);
+"""
+
+def _require_zstandard():
+    if zstandard is None:
+        raise ImportError("the page archive needs zstandard (pip install zstandard)")
+
+def _segment_name(segment):
+    return f"segment-{segment:05d}.zst"
+
+class PageArchive:
+    # append-only page store; safe to share between worker threads
+    #   level: zstd compression level
+    #   max_segment_bytes: a new segment file is started once the current one is this large
+    def __init__(self, path, level=3, max_segment_bytes=256 * 1024 * 1024):
+        _require_zstandard()
+        self.path = path
+        self.max_segment_bytes = max_segment_bytes
+        os.makedirs(path, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(path, 'index.sqlite'), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._compressor = zstandard.ZstdCompressor(level=level, write_content_size=True)
+        self._decompressor = zstandard.ZstdDecompressor()
+        self._lock = threading.Lock()
+        self._readers = {}
+        segments = self._conn.execute("SELECT MAX(segment) FROM blobs").fetchone()[0]
+        self._segment = segments or 1
+        self._segment_file = None
+
+    def _open_segment(self):
+        # appends go to the end of the file, after a crash the unindexed tail is simply never referenced
+        segment_path = os.path.join(self.path, _segment_name(self._segment))
+        if os.path.exists(segment_path) and os.path.getsize(segment_path) >= self.max_segment_bytes:
+            self._segment += 1
+            segment_path = os.path.join(self.path, _segment_name(self._segment))
+        self._segment_file = open(segment_path, 'ab')
+
+    def put(self, url, html, fetched_at=None):
+        # stores the page and points url at it; returns the content digest
+        data = html.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        fetched_at = fetched_at or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            known = self._conn.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            if known is None:
+                frame = self._compressor.compress(data)
+                if self._segment_file is None:
+                    self._open_segment()
+                elif self._segment_file.tell() >= self.max_segment_bytes:
+                    self._segment_file.close()
+                    self._segment += 1
+                    self._open_segment()
+                offset = self._segment_file.tell()
+                self._segment_file.write(frame)
+                self._segment_file.flush()
+                self._conn.execute(
+                    "INSERT INTO blobs (digest, segment, offset, length, size) VALUES (?, ?, ?, ?, ?)",
+                    (digest, self._segment, offset, len(frame), len(data)),
+                )
+            self._conn.execute(
+                "INSERT INTO pages (url, digest, fetched_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET digest = excluded.digest, fetched_at = excluded.fetched_at",
+                (url, digest, fetched_at),
+            )
+            self._conn.commit()
+        return digest
+
+    def _read(self, segment, offset, length):
+        reader = self._readers.get(segment)
+        if reader is None:
+            reader = self._readers[segment] = open(os.path.join(self.path, _segment_name(segment)), 'rb')
+        return self._decompressor.decompress(os.pread(reader.fileno(), length, offset)).decode('utf-8')
+
+    def get(self, url):
+        # latest stored html of url, or None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT b.segment, b.offset, b.length FROM pages p JOIN blobs b ON b.digest = p.digest WHERE p.url = ?",
+                (url,),
+            ).fetchone()
+            if row is None:
+                return None
+            if self._segment_file is not None:
+                self._segment_file.flush()
+            return self._read(*row)
+
+    def __contains__(self, url):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM pages WHERE url = ?", (url,)).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def entries(self):
+        # (url, fetched_at, segment, offset, length) of every page, in on-disk order for sequential reads
+        with self._lock:
+            return self._conn.execute(
+                "SELECT p.url, p.fetched_at, b.segment, b.offset, b.length FROM pages p "
+                "JOIN blobs b ON b.digest = p.digest ORDER BY b.segment, b.offset"
+            ).fetchall()
+
+    def stats(self):
+        with self._lock:
+            pages = self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+            blobs, stored, raw = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0), COALESCE(SUM(size), 0) FROM blobs"
+            ).fetchone()
+            segments = self._conn.execute("SELECT COUNT(DISTINCT segment) FROM blobs").fetchone()[0]
+        return {
+            'pages': pages,
+            'unique_pages': blobs,
+            'segments': segments,
+            'raw_mb': round(raw / 1024 / 1024, 1),
+            'stored_mb': round(stored / 1024 / 1024, 1),
+            'ratio': round(raw / stored, 1) if stored else None,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._segment_file is not None:
+                self._segment_file.flush()
+                os.fsync(self._segment_file.fileno())
+                self._segment_file.close()
+                self._segment_file = None
+            for reader in self._readers.values():
+                reader.close()
+            self._readers = {}
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+def open_archive(config):
+    # archive configured by config['page_archive_template'], None when archiving is turned off
+    template = config.get('page_archive_template')
+    if not template:
+        return None
+    return PageArchive(template.format(site_name=config['site_name']), level=config.get('page_archive_level', 3))
+
+# offline re-parse over a process pool
+# every worker process memory-maps the segment files once and decompresses the frames of its chunk
+
+_worker_segments = {}
+_worker_archive_path = None
+_worker_config = None
+
+def _init_reparse_worker(archive_path, config):
+    global _worker_archive_path, _worker_config
+    _worker_archive_path = archive_path
+    _worker_config = config
+    _worker_segments.clear()
+
+def _segment_map(segment):
+    mapped = _worker_segments.get(segment)
+    if mapped is None:
+        with open(os.path.join(_worker_archive_path, _segment_name(segment)), 'rb') as f:
+            mapped = _worker_segments[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return mapped
+
+def _reparse_chunk(entries):
+    # returns (rows, skipped) for one chunk of index entries
+    decompressor = zstandard.ZstdDecompressor()
+    rows, skipped = [], 0
+    for url, fetched_at, segment, offset, length in entries:
+        html = decompressor.decompress(_segment_map(segment)[offset:offset + length]).decode('utf-8')
+        row, is_essential_data_present, _ = extract_page(html, url, _worker_config)
+        if not is_essential_data_present:
+            skipped += 1
+            continue
+        row['parsed_at'] = fetched_at  # the data is as of the fetch, not as of this run
+        rows.append(row)
+    return rows, skipped
+
+def reparse(archive_path, config, output_path, output_format='csv', workers=None, chunk_size=500):
+    # re-extracts every archived page with the current config['selectors'] into a fresh output file
+    from writers import open_writer, sink_options
+
+    _require_zstandard()
+    with PageArchive(archive_path) as archive:
+        entries = archive.entries()
+    chunks = [entries[i:i + chunk_size] for i in range(0, len(entries), chunk_size)]
+    workers = workers or os.cpu_count() or 1
+    print(f"re-parsing {len(entries)} archived pages from {archive_path} with {workers} processes...")
+
+    parsed = skipped = 0
+    started = datetime.now()
+    with open_writer(output_path, config['columns'], output_format, batch_size=chunk_size,
+                     **sink_options(config, output_format)) as writer:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_reparse_worker,
+                                 initargs=(archive_path, config)) as pool:
+            for rows, chunk_skipped in pool.map(_reparse_chunk, chunks):
+                for row in rows:
+                    writer.write(row)
+                parsed += len(rows)
+                skipped += chunk_skipped
+                print(f"  {parsed + skipped}/{len(entries)} pages")
+    elapsed = (datetime.now() - started).total_seconds()
+    print(f"re-parsed {parsed} pages ({skipped} without essential fields) in {elapsed:.1f}s into {writer.sink.path}")
+    return parsed, skipped
+
+if __name__ == "__main__":
+    # usage:
+    #   python scripts/page_archive.py stats
+    #   python scripts/page_archive.py reparse <output path> [--format parquet] [--workers 8]
+    from web_scrapping import KOLESA_ALMATY_CONFIG as config
+
+    parser = argparse.ArgumentParser(description="raw html archive of ad pages")
+    parser.add_argument('command', choices=['stats', 'reparse'])
+    parser.add_argument('output', nargs='?', help="output csv file / parquet directory for reparse")
+    parser.add_argument('--archive', default=config['page_archive_template'].format(site_name=config['site_name']))
+    parser.add_argument('--format', default='csv', choices=['csv', 'parquet'])
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == 'stats':
+        with PageArchive(args.archive) as archive:
+            print(archive.stats())
+    else:
+        if not args.output:
+            parser.error("reparse needs an output path")
+        if os.path.abspath(args.output) == os.path.abspath(config['output_data_csv_template'].format(site_name=config['site_name'])):
+            print("refusing to append re-parsed rows to the live scraper output, pick another path")
+            sys.exit(1)
+        reparse(args.archive, config, args.output, args.format, args.workers)
@@ -0,0 +1,105 @@
+import time
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from extraction import get_extraction_plan
+
+# parse stage that runs beside the fetchers instead of inside them
+# fetch threads hand the raw html to submit() and go on with the next page,
+# a pool of processes extracts the rows and callback() runs in the parent once a page is done
+# at most max_pending pages are in flight: submit() blocks while the pool is behind, so memory stays flat
+
+def extract_page(page_source, url, config):
+    # returns (row, essential fields present, seconds spent parsing)
+    started = time.perf_counter()
+    row = get_extraction_plan(config).extract(page_source, url)
+    is_essential_data_present = all(row.get(field) for field in config.get('essential_fields', []))
+    return row, is_essential_data_present, time.perf_counter() - started
+
+_worker_config = None
+
+def _init_worker(config):
+    global _worker_config
+    _worker_config = config
+
+def _extract_in_worker(page_source, url):
+    return extract_page(page_source, url, _worker_config)
+
+class ParsePool:
+    # processes: parse processes, 0 parses inline on the calling thread (the old behaviour)
+    # max_pending: pages submitted but not yet handed to their callback
+    # callback(url, page_source, result, error) gets result = (row, essential_ok, seconds),
+    # or result = None and the exception when parsing failed; it runs on a pool thread, so it must be thread-safe
+    def __init__(self, config, processes=2, max_pending=64):
+        self.config = config
+        self.processes = processes
+        self._slots = threading.Semaphore(max(1, max_pending))
+        self._pending = 0
+        self._idle = threading.Condition()
+        self._executor = None
+        if processes:
+            # spawn: the fetch side runs threads (selenium, aiohttp), forking those is not safe
+            self._executor = ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(config,),
+            )
+
+    def submit(self, url, page_source, callback):
+        if self._executor is None:
+            try:
+                result, error = extract_page(page_source, url, self.config), None
+            except Exception as e:
+                result, error = None, e
+            callback(url, page_source, result, error)
+            return
+
+        self._slots.acquire()  # backpressure
+        with self._idle:
+            self._pending += 1
+        try:
+            future = self._executor.submit(_extract_in_worker, page_source, url)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(lambda f: self._done(f, url, page_source, callback))
+
+    def _done(self, future, url, page_source, callback):
+        try:
+            result, error = future.result(), None
+        except Exception as e:
+            result, error = None, e
+        try:
+            callback(url, page_source, result, error)
+        except Exception:
+            print(f"error handling parsed page {url}:")
+            traceback.print_exc()
+        finally:
+            self._release()
+
+    def _release(self):
+        self._slots.release()
+        with self._idle:
+            self._pending -= 1
+            self._idle.notify_all()
+
+    def drain(self):
+        # waits until every submitted page went through its callback
+        with self._idle:
+            self._idle.wait_for(lambda: self._pending == 0)
+
+    def close(self):
+        self.drain()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,164 @@
+import os
+import time
+import argparse
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import joblib
+from sklearn import __version__ as sklearn_version
+from sklearn.compose import ColumnTransformer, TransformedTargetRegressor
+from sklearn.ensemble import HistGradientBoostingRegressor
+from sklearn.metrics import mean_absolute_error, r2_score
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OrdinalEncoder
+from threadpoolctl import threadpool_limits
+
+from cleaning import read_chunks, split_brand, _to_numeric
+
+# price model of notebooks/prediction.ipynb as a script:
+#   python scripts/price_model.py train                       fits on the cleaned data and saves the pipeline
+#   python scripts/price_model.py score <input> <output>      estimates a fair price for every ad of a scraper output
+# categories are ordinal-encoded and handled natively by histogram gradient boosting,
+# so there is no one-hot matrix and missing values need no imputation
+
+NUMERIC_FEATURES = ['year', 'mileage', 'engine_volume_liters']
+CATEGORICAL_FEATURES = ['brand', 'model', 'body_style', 'color', 'transmission', 'drive_type']
+TARGET = 'price'
+
+DEFAULT_MODEL_PATH = 'data/models/price_model.joblib'
+
+def build_pipeline(max_iter=500, learning_rate=0.08, max_categories=250, random_state=42):
+    # rare models are grouped into one "infrequent" category, histogram boosting allows at most 255 bins per feature
+    encoder = OrdinalEncoder(
+        handle_unknown='use_encoded_value', unknown_value=np.nan, encoded_missing_value=np.nan,
+        max_categories=max_categories, dtype=np.float64,
+    )
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ('cat', encoder, CATEGORICAL_FEATURES),
+            ('num', 'passthrough', NUMERIC_FEATURES),
+        ]
+    )
+    categorical_mask = [True] * len(CATEGORICAL_FEATURES) + [False] * len(NUMERIC_FEATURES)
+    regressor = HistGradientBoostingRegressor(
+        categorical_features=categorical_mask,
+        max_iter=max_iter,
+        learning_rate=learning_rate,
+        early_stopping=True,
+        random_state=random_state,
+    )
+    # prices span two orders of magnitude, the model learns log(price)
+    return TransformedTargetRegressor(
+        regressor=Pipeline(steps=[('preprocessor', preprocessor), ('regressor', regressor)]),
+        func=np.log1p,
+        inverse_func=np.expm1,
+    )
+
+def features(df):
+    # model inputs in a fixed column order; text columns as plain objects so train and score data match
+    X = df.reindex(columns=CATEGORICAL_FEATURES + NUMERIC_FEATURES).copy()
+    for col in CATEGORICAL_FEATURES:
+        X[col] = X[col].astype(object).where(X[col].notna(), np.nan)
+    for col in NUMERIC_FEATURES:
+        X[col] = pd.to_numeric(X[col], errors='coerce').astype('float64')
+    return X
+
+def train(df, test_size=0.2, random_state=42, threads=None, **params):
+    # fits on a cleaned frame; returns (model, metrics on the held-out split)
+    # histogram boosting trains on all cores through openmp, threads caps that
+    df = df[df[TARGET].notna()]
+    X_train, X_test, y_train, y_test = train_test_split(
+        features(df), df[TARGET].astype('float64'), test_size=test_size, random_state=random_state,
+    )
+    model = build_pipeline(random_state=random_state, **params)
+    started = time.perf_counter()
+    with threadpool_limits(limits=threads, user_api='openmp'):
+        model.fit(X_train, y_train)
+        train_seconds = time.perf_counter() - started
+        y_pred = model.predict(X_test)
+    metrics = {
+        'mae': float(mean_absolute_error(y_test, y_pred)),
+        'r2': float(r2_score(y_test, y_pred)),
+        'n_train': len(X_train),
+        'n_test': len(X_test),
+        'train_seconds': round(train_seconds, 2),
+    }
+    return model, metrics
+
+def save_model(model, path, metrics=None):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    joblib.dump({
+        'model': model,
+        'features': CATEGORICAL_FEATURES + NUMERIC_FEATURES,
+        'metrics': metrics or {},
+        'trained_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'sklearn_version': sklearn_version,
+    }, path)
+
+class PriceModel:
+    # a saved pipeline loaded once, scoring frames or the row dicts the scraper produces
+    def __init__(self, path=DEFAULT_MODEL_PATH):
+        bundle = joblib.load(path)
+        if bundle.get('sklearn_version') != sklearn_version:
+            print(f"warning: {path} was trained with scikit-learn {bundle.get('sklearn_version')}, running {sklearn_version}")
+        self.path = path
+        self.model = bundle['model']
+        self.metrics = bundle.get('metrics', {})
+        self.trained_at = bundle.get('trained_at')
+
+    def predict(self, df):
+        # estimated prices for a cleaned frame
+        return self.model.predict(features(df))
+
+    def predict_raw(self, df):
+        # estimated prices for raw scraper rows ('brand' still holds the listing title)
+        return self.predict(_to_numeric(split_brand(df.copy())))
+
+    def predict_rows(self, rows):
+        return self.predict_raw(pd.DataFrame(rows))
+
+    def score_file(self, input_path, output_path, chunksize=100_000):
+        # writes url, price, predicted_price and price_ratio (asking / estimated) for every ad of a scraper output
+        rows = 0
+        started = time.perf_counter()
+        for n, chunk in enumerate(read_chunks(input_path, chunksize)):
+            predicted = self.predict_raw(chunk)
+            scored = pd.DataFrame({
+                'url': chunk['url'].to_numpy(),
+                'price': pd.to_numeric(chunk['price'], errors='coerce').to_numpy(),
+                'predicted_price': predicted.round(0),
+            })
+            scored['price_ratio'] = (scored['price'] / scored['predicted_price']).round(3)
+            scored.to_csv(output_path, mode='w' if n == 0 else 'a', header=n == 0, index=False)
+            rows += len(scored)
+        return rows, time.perf_counter() - started
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="train and apply the kolesa.kz price model")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    train_parser = subparsers.add_parser('train', help="fit on cleaned data and save the model")
+    train_parser.add_argument('--data', default='data/kolesa_almaty_cleaned.csv', help="cleaned csv file or parquet dataset")
+    train_parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    train_parser.add_argument('--threads', type=int, default=None, help="openmp threads, all cores by default")
+    score_parser = subparsers.add_parser('score', help="estimate prices for a raw scraper output")
+    score_parser.add_argument('input', help="raw csv file or parquet dataset written by web_scrapping.py")
+    score_parser.add_argument('output', help="csv file with url, price, predicted_price, price_ratio")
+    score_parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    score_parser.add_argument('--chunksize', type=int, default=100_000)
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        from cleaning import load_cleaned
+        df = load_cleaned(args.data)
+        print(f"training on {len(df)} cleaned ads from {args.data}...")
+        model, metrics = train(df, threads=args.threads)
+        save_model(model, args.model, metrics)
+        print(f"mae: {metrics['mae']:.0f}, r2: {metrics['r2']:.3f}, trained in {metrics['train_seconds']}s, saved to {args.model}")
+    else:
+        price_model = PriceModel(args.model)
+        rows, seconds = price_model.score_file(args.input, args.output, args.chunksize)
+        print(f"scored {rows} ads in {seconds:.2f}s ({seconds / max(rows, 1) * 1000:.3f} ms per ad): {args.output}")
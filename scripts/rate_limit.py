@@ -0,0 +1,127 @@
+import time
+import random
+import asyncio
+import threading
+from urllib.parse import urlparse
+
+# request pacing shared between scraper workers
+# every host gets a token bucket whose rate follows AIMD: it grows a little after every
+# healthy response and is cut (plus a jittered exponential pause) on timeouts, captchas, 429 and 5xx
+
+# response texts that mean we are being challenged instead of served
+CAPTCHA_MARKERS = ("captcha", "g-recaptcha", "cf-chl", "challenge-form")
+
+def looks_like_captcha(page_source):
+    if not page_source:
+        return False
+    head = page_source[:20000].lower()
+    return any(marker in head for marker in CAPTCHA_MARKERS)
+
+def is_throttle_status(status):
+    # http statuses that mean "slow down"
+    return status == 429 or status == 403 or 500 <= status < 600
+
+class _HostState:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.backoff_until = 0.0
+        self.failures = 0  # consecutive throttle signals
+        self.last_reason = None
+        self.successes = 0
+        self.throttles = 0
+
+class AdaptiveRateLimiter:
+    # per-host token bucket with additive increase / multiplicative decrease of the rate
+    #   initial_rate, min_rate, max_rate: requests per second to one host, across all workers
+    #   increase: added to the rate after every success
+    #   decrease: rate multiplier after a throttle signal
+    #   burst: tokens a host may save up while idle (1 = strictly spaced requests)
+    #   backoff, max_backoff: pause after the first / any later consecutive throttle signal (doubles each time)
+    #   jitter: relative random spread applied to every wait
+    def __init__(self, initial_rate=0.4, min_rate=0.05, max_rate=2.0, increase=0.05, decrease=0.5,
+                 burst=1.0, backoff=5.0, max_backoff=300.0, jitter=0.3):
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.burst = burst
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host(self, url):
+        host = urlparse(url).netloc
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState(self.initial_rate, self.burst)
+        return state
+
+    def _reserve(self, url):
+        # takes the next token of the host and returns how long to wait for it
+        with self._lock:
+            state = self._host(url)
+            now = time.monotonic()
+            state.tokens = min(self.burst, state.tokens + (now - state.updated) * state.rate)
+            state.updated = now
+            state.tokens -= 1
+            delay = max(-state.tokens / state.rate, state.backoff_until - now, 0.0)
+        if delay > 0 and self.jitter:
+            delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return delay
+
+    def wait(self, url):
+        # blocks until the caller may send a request to the host of url
+        delay = self._reserve(url)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait_async(self, url):
+        # same as wait() for coroutines running on an event loop
+        delay = self._reserve(url)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def success(self, url):
+        # healthy response: additive increase
+        with self._lock:
+            state = self._host(url)
+            state.rate = min(self.max_rate, state.rate + self.increase)
+            state.failures = 0
+            state.successes += 1
+
+    def throttled(self, url, reason):
+        # timeout / captcha / 429 / 5xx: multiplicative decrease and a jittered exponential pause
+        with self._lock:
+            state = self._host(url)
+            state.rate = max(self.min_rate, state.rate * self.decrease)
+            pause = min(self.max_backoff, self.backoff * (2 ** state.failures))
+            pause *= random.uniform(1 - self.jitter, 1 + self.jitter)
+            now = time.monotonic()
+            state.backoff_until = max(state.backoff_until, now + pause)
+            state.tokens = min(state.tokens, 0.0)
+            state.failures += 1
+            state.throttles += 1
+            state.last_reason = reason
+            rate = state.rate
+        print(f"  rate limiter: {reason} from {urlparse(url).netloc}, backing off {pause:.1f}s, rate now {rate:.2f} req/s")
+
+    def snapshot(self):
+        # current rate and backoff state per host
+        with self._lock:
+            now = time.monotonic()
+            return {
+                host: {
+                    'rate': round(state.rate, 3),
+                    'backoff_remaining': round(max(0.0, state.backoff_until - now), 1),
+                    'consecutive_throttles': state.failures,
+                    'successes': state.successes,
+                    'throttles': state.throttles,
+                    'last_reason': state.last_reason,
+                }
+                for host, state in self._hosts.items()
+            }
@@ -0,0 +1,89 @@
+import sys
+import json
+import hashlib
+import argparse
+from datetime import datetime
+
+from crawl_state import CrawlState
+
+# revisiting parsed ads to catch price drops and edits
+# every successful parse is fingerprinted; a fingerprint that differs from the last one adds a version
+# to the append-only history table of the crawl state (see CrawlState.record_version)
+# RevisitPolicy decides when an ad is due again: new and often-changing ads soon, old and stable ads rarely
+
+def fingerprint(row, fields):
+    # short stable hash of the tracked fields of a parsed row
+    payload = json.dumps([row.get(field) for field in fields], ensure_ascii=False, default=str)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=8).hexdigest()
+
+def fingerprint_fields(config):
+    # fields whose change makes a new version; url and parse time never count, nor does model:
+    # brand already holds the whole title, and rows saved from listing cards have no model
+    fields = config.get('fingerprint_fields')
+    if fields:
+        return list(fields)
+    return [col for col in config['columns'] if col not in ('url', 'parsed_at', 'model')]
+
+class RevisitPolicy:
+    # hours until the next visit:
+    #   base_hours * (1 + age_days / age_scale_days) / (1 + volatility_weight * changes / visits)
+    # clamped to [min_hours, max_hours]; an ad that just changed comes back after min_hours
+    # retry_hours: next try after a failed or skipped revisit (timeout, captcha, essential fields missing)
+    def __init__(self, min_hours=12, base_hours=48, max_hours=336, age_scale_days=30,
+                 volatility_weight=4.0, retry_hours=6):
+        self.min_hours = min_hours
+        self.base_hours = base_hours
+        self.max_hours = max_hours
+        self.age_scale_days = age_scale_days
+        self.volatility_weight = volatility_weight
+        self.retry_hours = retry_hours
+
+    def hours_until_next(self, first_seen, visits, changes, changed):
+        if changed:
+            return self.min_hours
+        age_days = max(0.0, (datetime.now() - first_seen).total_seconds() / 86400)
+        volatility = changes / visits if visits else 0.0
+        hours = self.base_hours * (1 + age_days / self.age_scale_days) / (1 + self.volatility_weight * volatility)
+        return min(self.max_hours, max(self.min_hours, hours))
+
+def load_history(state_path, url=None):
+    # history table as a data frame: one row per version with url, observed_at and the parsed fields
+    import pandas as pd
+
+    with CrawlState(state_path) as state:
+        versions = state.history(url)
+    rows = [dict(fields, url=version_url, observed_at=observed_at, fingerprint=digest)
+            for version_url, observed_at, digest, fields in versions]
+    df = pd.DataFrame(rows)
+    if not df.empty:
+        df['observed_at'] = pd.to_datetime(df['observed_at'])
+        df['version'] = df.groupby('url').cumcount() + 1
+    return df
+
+if __name__ == "__main__":
+    # usage:
+    #   python scripts/revisits.py due                   number of ads due for a revisit
+    #   python scripts/revisits.py history out.csv       every stored version
+    #   python scripts/revisits.py changes out.csv       only ads with more than one version
+    from web_scrapping import KOLESA_ALMATY_CONFIG as config
+
+    parser = argparse.ArgumentParser(description="price history of revisited ads")
+    parser.add_argument('command', choices=['due', 'history', 'changes'])
+    parser.add_argument('output', nargs='?')
+    parser.add_argument('--state', default=config['state_db_template'].format(site_name=config['site_name']))
+    args = parser.parse_args()
+
+    if args.command == 'due':
+        max_attempts = config.get('max_attempts', 3)
+        with CrawlState(args.state) as state:
+            print(f"{len(state.urls_due(max_attempts=max_attempts))} ads due for a revisit, "
+                  f"{state.retired_count(max_attempts)} retired, crawl state: {state.counts()}")
+        sys.exit(0)
+
+    if not args.output:
+        parser.error(f"{args.command} needs an output csv path")
+    history = load_history(args.state)
+    if args.command == 'changes' and not history.empty:
+        history = history[history.groupby('url')['url'].transform('size') > 1]
+    history.to_csv(args.output, index=False)
+    print(f"saved {len(history)} versions of {history['url'].nunique() if not history.empty else 0} ads to {args.output}")
@@ -1,29 +1,56 @@
-import os
-import re
 import time
 import random
+import queue
+import functools
+import threading
 from datetime import datetime
 import pandas as pd
 from bs4 import BeautifulSoup
 import traceback
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlsplit
 
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service as ChromeService
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.options import Options as ChromeOptions
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import NoSuchElementException, TimeoutException, WebDriverException
 
+from crawl_state import CrawlState, PARSED, SKIPPED, FAILED, FIRST
+from driver_factory import ManagedDriver, resolve_driver_path
+from extraction import clean_text, extract_numeric, extract_float, get_extraction_plan
+from fetchers import HttpFetcher
+from writers import open_writer, sink_options
+from metrics import open_run_metrics
+from page_archive import open_archive
+from parse_pool import ParsePool
+from revisits import RevisitPolicy, fingerprint, fingerprint_fields
+from rate_limit import AdaptiveRateLimiter, looks_like_captcha
+
 # configuration for kolesa.kz
 # main settings for parsing the site
 KOLESA_ALMATY_CONFIG = {
     "site_name": "kolesa_almaty",
     "base_url": "https://kolesa.kz",  # base url for joining relative links
+    # offline runs: fetch ad pages from this host instead, e.g. "http://127.0.0.1:8000" (scripts/bench_server.py);
+    # rows and the crawl state keep the original kolesa.kz urls
+    "fetch_base_url": None,
     "input_urls_csv_template": "{site_name}_found_urls.csv",  # input file template
     "output_data_csv_template": "{site_name}_data.csv",  # output file template
+    "state_db_template": "data/{site_name}_state.sqlite",  # crawl state shared with find_urls.py
+    "max_attempts": 3,  # failed urls are retried until they have this many attempts
+    # revisit mode: parsed ads are fetched again when due (see revisits.RevisitPolicy),
+    # changed fields are stored as new versions in the history table of the crawl state
+    "revisit": {"min_hours": 12, "base_hours": 48, "max_hours": 336, "age_scale_days": 30, "volatility_weight": 4.0},
+    "revisit_batch": 500,  # most revisits per run
+    "fingerprint_fields": None,  # fields compared between visits, None = every column except url, parsed_at and model
+    "output_data_parquet_template": "{site_name}_data",  # output directory of the parquet dataset (partitioned by parsed_at date)
+    "partition_by_city": False,  # parquet only: also partition by city
+    "output_format": "csv",  # 'csv' or 'parquet'
+    "write_batch_size": 100,  # rows buffered before a flush to disk
+    "write_flush_interval": 30.0,  # seconds before a partially filled buffer is flushed anyway
+    "parse_processes": 2,  # processes parsing html beside the fetchers, 0 parses on the fetch thread
+    "parse_queue_size": 64,  # pages waiting for a parse process before fetchers pause
+    "page_archive_template": "data/{site_name}_pages",  # zstd archive of every fetched ad page, None to turn off
+    "metrics_dir": "data/metrics",  # per-run stage timings (.jsonl) and summary (.json)
     "columns": [  # output csv structure
         'brand', 'model', 'year', 'city', 'price', 'mileage',
         'engine_volume_liters', 'body_style', 'color', 'transmission',
@@ -32,6 +59,17 @@ KOLESA_ALMATY_CONFIG = {
     "wait_timeout": 10,  # increased timeout
     "wait_for_selector": "div.offer__price",  # element to wait for on the ad page
     "url_prefix_needed": True,  # whether to add prefix to relative urls
+    "workers": 1,  # number of parallel chrome instances
+    "headless": True,
+    "block_images": True,  # images and web fonts are never parsed, skip downloading them
+    "driver_recycle_pages": 200,  # restart a chrome instance after this many pages
+    "driver_max_memory_mb": 1500,  # ...or when it grows above this (needs psutil)
+    # adaptive per-host pacing shared by all workers (see rate_limit.AdaptiveRateLimiter):
+    # starts at initial_rate requests/second, ramps up on healthy pages, halves and backs off on timeouts/captchas
+    "rate_limit": {"initial_rate": 0.4, "min_rate": 0.05, "max_rate": 2.0, "increase": 0.05},
+    "fetch_backend": "selenium",  # 'http' fetches pages without a browser and falls back to selenium for incomplete pages
+    "http_concurrency": 8,  # keep-alive connections used by the http backend
+    "http_rate_limit": {"initial_rate": 2.0, "min_rate": 0.1, "max_rate": 10.0, "increase": 0.1},  # one request per ad, no assets
 
     # selectors and parsing rules
     # maps column names to data extraction methods
@@ -59,55 +97,25 @@ KOLESA_ALMATY_CONFIG = {
         }
         # add more selectors or handlers for other sites
     },
-    "essential_fields": ['brand', 'price']  # fields that must be filled to save data
+    "essential_fields": ['brand', 'price'],  # fields that must be filled to save data
+    # listing cards stored by find_urls.py (cards mode): an ad whose card fills every column is saved
+    # from the card without opening its page, the other ads fetch their page and the card fills gaps
+    "use_listing_cards": True
 }
 
-# utilities
-def init_csv(path, columns):
-    # creates csv file with headers if it doesn't exist or is empty
-    if not os.path.exists(path) or os.path.getsize(path) == 0:
-        print(f"creating/resetting csv with header: {path}")
-        pd.DataFrame(columns=columns).to_csv(path, index=False, encoding='utf-8')
-
-def save_to_csv(data: dict, path, columns):
-    # appends a row of data to the csv file
+# parsing html
+def parse_html_details(page_source, url, config):
+    # parses html page with the precompiled extraction plan for this configuration
     try:
-        # saves only specified columns in the correct order
-        data_to_save = {col: data.get(col) for col in columns}
-        df_to_save = pd.DataFrame([data_to_save], columns=columns)
-        
-        file_exists = os.path.exists(path)
-        header = not file_exists or os.path.getsize(path) == 0
-        
-        df_to_save.to_csv(path, mode='a', header=header, index=False, encoding='utf-8')
+        return get_extraction_plan(config).extract(page_source, url)
     except Exception as e:
-        print(f"error saving data to {path}: {e}")
-        print(f"data attempted to save: {data}")  # log problematic data
-
-def clean_text(text):
-    # removes extra spaces from text
-    return ' '.join(text.split()) if text else None
-
-def extract_numeric(text):
-    # extracts numeric value from text
-    if not text: return None
-    digits = re.findall(r'\d+', str(text))
-    return int("".join(digits)) if digits else None
-
-def extract_float(text):
-    # extracts floating-point number from text
-    if not text: return None
-    match = re.search(r'(\d[\d\s]*[.,]?\d*)', str(text).replace(' ', '')) 
-    if match:
-        try:
-            return float(match.group(1).replace(',', '.'))
-        except ValueError:
-            return None
-    return None
+        print(f"error parsing details for {url}: {e}")
+        traceback.print_exc()
+        return {col: None for col in config['columns']}
 
-# parsing html
-def parse_html_details(page_source, url, config):
-    # parses html page using beautifulsoup based on configuration
+def parse_html_details_bs4(page_source, url, config):
+    # reference implementation: parses html page using beautifulsoup based on configuration
+    # parse_html_details must return the same fields, see extraction.benchmark
     extracted_data = {}
     try:
         soup = BeautifulSoup(page_source, 'lxml')
@@ -177,161 +185,486 @@ def parse_html_details(page_source, url, config):
         traceback.print_exc()
         return {col: None for col in config['columns']}
 
+def fetch_url(ad_url, config):
+    # the url an ad page is actually requested from, see config['fetch_base_url']
+    fetch_base_url = config.get('fetch_base_url')
+    if not fetch_base_url:
+        return ad_url
+    base = urlsplit(fetch_base_url)
+    return urlsplit(ad_url)._replace(scheme=base.scheme, netloc=base.netloc).geturl()
+
+# selenium helpers
+class ParseRun:
+    # everything one parse_urls() run shares between fetch threads and the parse pool callbacks:
+    # output writer, crawl state, metrics, page archive and the outcome counters
+    # revisits: urls that are already parsed and fetched again for changes
+    # rewrite_known: save every parsed row to the output, not only the first version of an ad
+    # cards: {url: (card fields, missing columns)} harvested from the listing pages
+    def __init__(self, config, writer, state, metrics, archive, parser, revisits=(), rewrite_known=False, cards=None):
+        self.config = config
+        self.writer = writer
+        self.state = state
+        self.metrics = metrics
+        self.archive = archive
+        self.parser = parser
+        self.revisits = set(revisits)
+        self.rewrite_known = rewrite_known
+        self.revisit_policy = RevisitPolicy(**config.get('revisit', {}))
+        self.fingerprint_fields = fingerprint_fields(config)
+        self.cards = cards or {}
+        self.counts = {PARSED: 0, SKIPPED: 0, FAILED: 0, 'not_processed': 0, 'changed': 0, 'unchanged': 0, 'from_card': 0}
+        self._lock = threading.Lock()
+
+    def record(self, ad_url, status, error=None):
+        self.metrics.count(status)
+        with self._lock:
+            self.counts[status] += 1
+        if status != PARSED and ad_url in self.revisits:
+            # failed or skipped (captcha, fields missing): the ad stays 'parsed' and keeps its schedule
+            self.state.reschedule(ad_url, self.revisit_policy.retry_hours, error)
+        elif status != PARSED:  # parsed urls are marked once their row is flushed
+            self.state.mark(ad_url, status, error)
+
+    def _save(self, ad_url, extracted_data):
+        # new history version if the fields changed; the output gets the first version of every ad
+        version = self.state.record_version(
+            ad_url, extracted_data, fingerprint(extracted_data, self.fingerprint_fields),
+            self.revisit_policy.hours_until_next,
+        )
+        if version == FIRST or self.rewrite_known:
+            with self.metrics.stage('save'):
+                self.writer.write(extracted_data)
+        if version != FIRST:
+            self.metrics.count(version)
+            with self._lock:
+                self.counts[version] += 1
+        return version
+
+    def save_cards(self, urls):
+        # saves the ads whose listing card fills every fingerprint field; returns the urls that still need their page
+        # (a card that misses a field, e.g. no color or mileage, queues the ad page fetch for it)
+        # card rows leave model empty, cleaning.split_brand takes it from the title
+        remaining = []
+        for ad_url in urls:
+            card = self.cards.get(ad_url)
+            if card is None or ad_url in self.revisits:
+                remaining.append(ad_url)
+                continue
+            fields, missing = card
+            if missing or any(fields.get(col) in (None, '') for col in self.fingerprint_fields):
+                remaining.append(ad_url)
+                continue
+            row = {col: fields.get(col) for col in self.config['columns']}
+            row['url'] = ad_url
+            row['parsed_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            self._save(ad_url, row)
+            self.record(ad_url, PARSED)
+            self.metrics.count('from_card')
+            with self._lock:
+                self.counts['from_card'] += 1
+        return remaining
+
+    def _with_card(self, ad_url, extracted_data):
+        # the ad page wins, its listing card only fills the fields the page did not have
+        card = self.cards.get(ad_url)
+        if card is None:
+            return extracted_data
+        fields = card[0]
+        return {col: fields.get(col) if value is None and col != 'parsed_at' else value
+                for col, value in extracted_data.items()}
+
+    def not_processed(self, n):
+        with self._lock:
+            self.counts['not_processed'] += n
+
+    def _archive(self, ad_url, page_source):
+        if self.archive is not None:
+            with self.metrics.stage('archive'):
+                self.archive.put(ad_url, page_source)
+
+    def ad_parsed(self, rate_limiter, ad_url, page_source, result, error):
+        # parse pool callback for pages rendered by selenium
+        status, error = self._ad_outcome(rate_limiter, ad_url, page_source, result, error)
+        self.record(ad_url, status, error)
+
+    def _ad_outcome(self, rate_limiter, ad_url, page_source, result, error):
+        # returns ('parsed' | 'skipped' | 'failed', error message or None)
+        essential_fields = self.config.get('essential_fields', [])
+        if result is None:
+            print(f"  skipping save: parsing function failed for {ad_url}: {type(error).__name__} - {error}")
+            self.metrics.failure("parsing failed", url=ad_url)
+            return FAILED, "parsing failed"
+
+        extracted_data, is_essential_data_present, parse_seconds = result
+        self.metrics.observe('parse', parse_seconds)
+        # same rule as http_parsed: ad pages embed recaptcha, only a page without the essential fields is a captcha
+        is_captcha = not is_essential_data_present and looks_like_captcha(page_source)
+        if not is_captcha:
+            self._archive(ad_url, page_source)
+
+        if is_essential_data_present:
+            rate_limiter.success(ad_url)
+            version = self._save(ad_url, self._with_card(ad_url, extracted_data))
+            print(f"  success: saved data for {ad_url}" if version == FIRST else f"  revisit: {version} {ad_url}")
+            return PARSED, None
+        elif is_captcha:
+            rate_limiter.throttled(ad_url, "captcha")
+            self.metrics.failure("captcha", url=ad_url)
+            print(f"  captcha page instead of the ad: {ad_url}")
+            return FAILED, "captcha"
+        else:
+            rate_limiter.success(ad_url)
+            print(f"  skipping save: essential data missing ({', '.join(essential_fields)}) for {ad_url}")
+            print(f"  extracted: { {k: v for k, v in extracted_data.items() if k in essential_fields} }")
+            return SKIPPED, "essential data missing"
+
+    def http_parsed(self, rate_limiter, fallback_urls, ad_url, page_source, result, error):
+        # parse pool callback for pages fetched over http, anything short of a full row goes to selenium
+        if result is None:
+            print(f"  parsing failed for {ad_url}: {type(error).__name__} - {error}")
+            self.metrics.failure("parsing failed", url=ad_url, backend='http')
+            fallback_urls.append(ad_url)
+            return
+        extracted_data, is_essential_data_present, parse_seconds = result
+        self.metrics.observe('parse', parse_seconds)
+        if is_essential_data_present:
+            self._archive(ad_url, page_source)
+            version = self._save(ad_url, self._with_card(ad_url, extracted_data))
+            self.record(ad_url, PARSED)
+            print(f"  success (http): saved data for {ad_url}" if version == FIRST else f"  revisit (http): {version} {ad_url}")
+        elif looks_like_captcha(page_source):
+            rate_limiter.throttled(fetch_url(ad_url, self.config), "captcha")
+            self.metrics.failure("captcha", url=ad_url, backend='http')
+            print(f"  captcha page instead of the ad (http): {ad_url}")
+            fallback_urls.append(ad_url)
+        else:
+            self._archive(ad_url, page_source)
+            self.metrics.count('http_fallback')
+            fallback_urls.append(ad_url)
+
+def _webdriver_failed(ad_url, error, metrics):
+    print(f"  webdriverexception during processing {ad_url}: {error}")
+    metrics.failure("WebDriverException", url=ad_url)
+    return FAILED, "WebDriverException"
+
+def process_ad(driver, ad_url, config, rate_limiter, run):
+    # loads one ad page and hands its html to the parse pool, which saves the row
+    # returns (None, None) once the page is handed over, ('failed', error message) when loading failed
+    wait_timeout = config.get('wait_timeout', 10)
+    wait_selector = config.get('wait_for_selector')
+    metrics = run.metrics
+
+    try:
+        with metrics.stage('rate_limit_wait'):
+            rate_limiter.wait(ad_url)
+
+        with metrics.stage('driver_get'):
+            driver.get(fetch_url(ad_url, config))
+
+        with metrics.stage('wait_for_selector'):
+            if wait_selector:
+                WebDriverWait(driver, wait_timeout).until(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, wait_selector))
+                )
+            else:
+                time.sleep(random.uniform(1.0, 2.0))  # no element to wait for, give the page time to render
+
+        with metrics.stage('page_source'):
+            ad_page_source = driver.page_source
+
+        with metrics.stage('parse_queue_wait'):
+            run.parser.submit(ad_url, ad_page_source, functools.partial(run.ad_parsed, rate_limiter))
+        return None, None
+
+    except TimeoutException:
+        print(f"  timeout waiting for element '{wait_selector}' on ad page: {ad_url}")
+        # a revisit that times out is usually a removed ad, only a captcha slows the crawl down then
+        try:
+            throttle = ad_url not in run.revisits or looks_like_captcha(driver.page_source)
+        except WebDriverException as e_wd:  # the session died, the worker discards the driver
+            return _webdriver_failed(ad_url, e_wd, metrics)
+        if throttle:
+            rate_limiter.throttled(ad_url, "timeout")
+        metrics.failure("TimeoutException", url=ad_url)
+        return FAILED, "TimeoutException"
+    except WebDriverException as e_wd:
+        return _webdriver_failed(ad_url, e_wd, metrics)
+    except Exception as e:
+        print(f"  error processing ad {ad_url}: {type(e).__name__} - {e}")
+        traceback.print_exc()
+        metrics.failure(type(e).__name__, url=ad_url)
+        return FAILED, type(e).__name__
+
+def _parser_worker(url_queue, total, config, run, driver_options, rate_limiter, stop_event):
+    # one worker = one managed chrome instance pulling urls from the shared queue
+    name = threading.current_thread().name
+    managed = ManagedDriver(name=name, **driver_options)
+    try:
+        with run.metrics.stage('driver_start'):
+            managed.driver  # start up front so a broken setup is reported before taking urls
+    except WebDriverException as e_wd:
+        print(f"[{name}] webdriverexception setting up webdriver: {e_wd}")
+        print("this might be due to chromedriver issues (version mismatch, permissions) or chrome browser problems.")
+        return
+    except Exception as e:
+        print(f"[{name}] error setting up webdriver: {e}")
+        return
+    print(f"[{name}] webdriver setup complete.")
+
+    try:
+        while not stop_event.is_set():
+            try:
+                i, ad_url = url_queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                driver = managed.driver
+            except Exception as e:
+                print(f"[{name}] could not restart webdriver, worker stops: {e}")
+                url_queue.put((i, ad_url))
+                break
+            print(f"[{name}] parsing ad {i+1}/{total}: {ad_url}")
+            status, error = process_ad(driver, ad_url, config, rate_limiter, run)
+            if status is not None:  # handed over pages are recorded by the parse pool callback
+                run.record(ad_url, status, error)
+            if error == "WebDriverException":
+                print(f"[{name}] discarding the possibly dead webdriver session.")
+                run.metrics.count('driver_restarts')
+                managed.discard()
+            else:
+                managed.page_done()
+    finally:
+        print(f"[{name}] closing webdriver.")
+        managed.quit()
+
+CSV_IMPORT_KEY = 'csv_import'  # meta key set once the csv files were imported into the crawl state
+
 # main parsing logic
-def run_selenium_parser_from_file(config, max_ads=None, update=True):
+def run_selenium_parser_from_file(config, max_ads=None, update=True, revisit=False):
     # runs the parser using selenium and a list of urls from a file
+    # revisit: also fetch parsed ads that are due again (update mode only), changes go to the history table
     site_name = config['site_name']
     input_path = config['input_urls_csv_template'].format(site_name=site_name)
-    data_path = config['output_data_csv_template'].format(site_name=site_name)
+    output_format = config.get('output_format', 'csv')
+    data_path = config[f'output_data_{output_format}_template'].format(site_name=site_name)
     columns = config['columns']
     base_url = config.get('base_url')
     url_prefix_needed = config.get('url_prefix_needed', False)
-    wait_timeout = config.get('wait_timeout', 10)
-    wait_selector = config.get('wait_for_selector')
-    essential_fields = config.get('essential_fields', [])
 
-    init_csv(data_path, columns)
+    state_path = config['state_db_template'].format(site_name=site_name)
+
+    with CrawlState(state_path) as state:
+        # the csv files are imported once per store, also into a store find_urls.py already filled
+        if state.get_meta(CSV_IMPORT_KEY) is None:
+            if import_url_files(state, input_path, data_path, output_format, base_url if url_prefix_needed else None):
+                state.set_meta(CSV_IMPORT_KEY, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+
+        print(f"crawl state ({state_path}): {state.counts()}")
+        if update:
+            print("update mode on: only pending urls and failed urls with attempts left.")
+            urls_to_parse = state.urls_to_parse(max_attempts=config.get('max_attempts', 3), limit=max_ads)
+        else:
+            urls_to_parse = state.all_urls(limit=max_ads)
+
+        revisit_urls = []
+        if revisit and update:
+            max_attempts = config.get('max_attempts', 3)
+            revisit_urls = state.urls_due(limit=config.get('revisit_batch', 500), max_attempts=max_attempts)
+            print(f"revisit mode on: {len(revisit_urls)} parsed ads are due for a revisit, "
+                  f"{state.retired_count(max_attempts)} retired after {max_attempts} failed revisits in a row.")
+
+        if not urls_to_parse and not revisit_urls:
+            print("no new urls to parse. exiting.")
+            return
+        if max_ads is not None and len(urls_to_parse) == max_ads:
+            print(f"limiting parsing to first {max_ads} ads from the remaining list.")
+
+        parse_urls(urls_to_parse + revisit_urls, config, state, data_path, output_format,
+                   revisits=revisit_urls, rewrite_known=not update)
+
+def import_url_files(state, input_path, data_path, output_format, base_url=None):
+    # one-time migration of the csv-based workflow into the state store:
+    # urls already in the data file become 'parsed' (also when find_urls.py added them as pending),
+    # the rest of the url file 'pending'
+    # returns False when the data file could not be read, the import is then tried again on the next run
+    try:
+        if output_format == 'parquet':
+            parsed_urls = pd.read_parquet(data_path, columns=['url'])['url']
+        else:
+            parsed_urls = pd.read_csv(data_path, dtype={'url': str}, usecols=['url'])['url']
+        imported = state.import_parsed(parsed_urls.dropna().astype(str).unique())
+        print(f"imported {imported} previously parsed urls from {data_path}")
+    except FileNotFoundError:
+        print(f"output file '{data_path}' not found, nothing parsed yet.")
+    except Exception as e:
+        print(f"error importing previously parsed urls from {data_path}: {e}")
+        return False
 
     print(f"--- loading urls from {input_path} ---")
     try:
-        urls_to_parse_df = pd.read_csv(input_path, dtype={'url': str})
-        if urls_to_parse_df.empty or 'url' not in urls_to_parse_df.columns:
-            print(f"url file '{input_path}' is empty or missing 'url' column. exiting.")
-            return
-        
-        if url_prefix_needed and base_url:
+        urls_df = pd.read_csv(input_path, dtype={'url': str})
+        if urls_df.empty or 'url' not in urls_df.columns:
+            print(f"url file '{input_path}' is empty or missing 'url' column.")
+            return True
+        urls = urls_df['url'].dropna().astype(str)
+        if base_url:
             print(f"prepending base url '{base_url}' to relative urls...")
-            urls_to_parse_df['url'] = urls_to_parse_df['url'].apply(
-                lambda x: x if str(x).startswith('http') else urljoin(base_url, str(x))
-            )
-
-        urls_to_parse_df.drop_duplicates(subset=['url'], inplace=True)
-        print(f"loaded {len(urls_to_parse_df)} unique urls.")
+            urls = urls.apply(lambda x: x if x.startswith('http') else urljoin(base_url, x))
+        imported = state.upsert_urls(urls.unique())
+        print(f"imported {imported} new urls as pending.")
     except FileNotFoundError:
-        print(f"input url file '{input_path}' not found. cannot parse details.")
-        return
+        print(f"input url file '{input_path}' not found.")
     except Exception as e:
         print(f"error loading urls from {input_path}: {e}")
-        return
-
-    if update:
-        print("update mode on: filtering out already parsed urls...")
-        try:
-            existing_data_df = pd.read_csv(data_path, dtype={'url': str}, usecols=['url'])
-            if not existing_data_df.empty:
-                parsed_urls = set(existing_data_df['url'].astype(str))
-                print(f"found {len(parsed_urls)} previously parsed urls in {data_path}")
-                original_count = len(urls_to_parse_df)
-                urls_to_parse_df = urls_to_parse_df[~urls_to_parse_df['url'].isin(parsed_urls)].copy()
-                print(f"urls remaining to parse after filtering: {len(urls_to_parse_df)} (filtered out {original_count - len(urls_to_parse_df)})")
-            else:
-                print(f"output file '{data_path}' exists but is empty or has no urls. no filtering applied.")
-        except FileNotFoundError:
-            print(f"output file '{data_path}' not found for update check. no filtering applied.")
-        except Exception as e:
-            print(f"error loading or processing previously parsed data from {data_path} for update check: {e}")
-            print("proceeding without filtering (potential duplicates).")
-
-    if urls_to_parse_df.empty:
-        print("no new urls to parse. exiting.")
-        return
-
-    urls_to_parse = urls_to_parse_df['url'].tolist()
+    return True
 
-    if max_ads is not None and len(urls_to_parse) > max_ads:
-        print(f"limiting parsing to first {max_ads} ads from the remaining list.")
-        urls_to_parse = urls_to_parse[:max_ads]
+def parse_urls(urls_to_parse, config, state, data_path, output_format, revisits=(), rewrite_known=False):
+    # fetches, parses and saves the given ad urls, recording each outcome in the state store
+    columns = config['columns']
+    writer = open_writer(
+        data_path, columns, output_format,
+        batch_size=config.get('write_batch_size', 100),
+        flush_interval=config.get('write_flush_interval', 30.0),
+        on_flush=lambda rows: state.mark_many([row['url'] for row in rows], PARSED),
+        **sink_options(config, output_format),
+    )
+
+    metrics, summary_path = open_run_metrics(config.get('metrics_dir', 'data/metrics'), f"{config['site_name']}_details")
+    archive = open_archive(config)
+    parser = ParsePool(config, processes=config.get('parse_processes', 2), max_pending=config.get('parse_queue_size', 64))
+    cards = {}
+    if config.get('use_listing_cards', True):
+        revisit_set = set(revisits)
+        cards = state.cards(url for url in urls_to_parse if url not in revisit_set)
+    run = ParseRun(config, writer, state, metrics, archive, parser, revisits, rewrite_known, cards)
 
-    chrome_options = ChromeOptions()
-    chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument("--window-size=1280,800")
-    user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36"
-    chrome_options.add_argument(f'user-agent={user_agent}')
-    chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-    chrome_options.add_experimental_option('useAutomationExtension', False)
+    try:
+        with writer:
+            try:
+                if cards:
+                    with metrics.stage('save_cards'):
+                        urls_to_parse = run.save_cards(urls_to_parse)
+                    print(f"{run.counts['from_card']} ads saved from their listing cards, {len(urls_to_parse)} still need their ad page.")
+                if urls_to_parse and config.get('fetch_backend', 'selenium') == 'http':
+                    urls_to_parse = run_http_fetch(urls_to_parse, config, run)
+                    if urls_to_parse:
+                        print(f"\n{len(urls_to_parse)} urls need a selenium fallback.")
+                if urls_to_parse:
+                    run_selenium_pool(urls_to_parse, config, run)
+            finally:
+                parser.close()  # pages still in the pool are saved before the writer closes
+    finally:
+        counts = run.counts
+        metrics.count('not_processed', counts['not_processed'])
+        metrics.print_summary()
+        metrics.write_summary(summary_path)
+        metrics.close()
+        if archive is not None:
+            print(f"page archive: {archive.stats()}")
+            archive.close()
+        print("\n--- scraping process finished ---")
+        revisited_ok = 0 if rewrite_known else counts['changed'] + counts['unchanged']
+        print(f"successfully parsed and saved: {counts['parsed'] - revisited_ok}")
+        if counts['from_card']:
+            print(f"  of these from listing cards: {counts['from_card']}")
+        print(f"skipped (missing essential data): {counts['skipped']}")
+        print(f"failed (errors or timeouts): {counts['failed']}")
+        if revisits:
+            print(f"revisited: {len(revisits)}, changed: {counts['changed']}, unchanged: {counts['unchanged']}")
+        if counts['not_processed']:
+            print(f"not processed (no live workers): {counts['not_processed']}")
+        print(f"data saved to: {writer.sink.path}")
+        print(f"run metrics saved to: {summary_path}")
+
+def run_http_fetch(urls_to_parse, config, run):
+    # fast path: fetches ad pages over plain http without a browser
+    # returns the urls that failed or came back without the essential fields,
+    # those are retried with selenium
+    metrics = run.metrics
+    rate_limiter = AdaptiveRateLimiter(**config.get('http_rate_limit', {}))
+    fetcher = HttpFetcher(
+        concurrency=config.get('http_concurrency', 8),
+        timeout=config.get('wait_timeout', 10),
+        rate_limiter=rate_limiter,
+        metrics=metrics,
+    )
+    fallback_urls = []
+    on_parsed = functools.partial(run.http_parsed, rate_limiter, fallback_urls)
+    ad_urls = {fetch_url(ad_url, config): ad_url for ad_url in urls_to_parse}
+
+    def handle(url, page_source, error):
+        ad_url = ad_urls[url]
+        if error:
+            print(f"  http fetch failed for {ad_url}: {error}")
+            metrics.failure(error.split(':')[0], url=ad_url, backend='http')  # exception name without its message
+            fallback_urls.append(ad_url)
+            return
+        # blocks the event loop while the parse pool is full, which pauses fetching as well
+        with metrics.stage('parse_queue_wait'):
+            run.parser.submit(ad_url, page_source, on_parsed)
+
+    print(f"\n--- starting detail parsing phase for {len(urls_to_parse)} urls (http, {fetcher.concurrency} connections) ---")
+    fetcher.fetch_all(list(ad_urls), handle)
+    run.parser.drain()  # the fallback list is complete once every fetched page is parsed
+    print(f"http rate limiter: {rate_limiter.snapshot()}")
+    return fallback_urls
+
+def run_selenium_pool(urls_to_parse, config, run):
+    # slow path: renders ad pages in config['workers'] parallel chrome instances
+    workers = max(1, int(config.get('workers', 1)))
+    rate_limiter = AdaptiveRateLimiter(**config.get('rate_limit', {}))
+    driver_options = dict(
+        headless=config.get('headless', True),
+        block_images=config.get('block_images', True),
+        max_pages=config.get('driver_recycle_pages', 200),
+        max_memory_mb=config.get('driver_max_memory_mb', 1500),
+    )
 
-    driver = None
     print("setting up webdriver...")
     try:
-        service = ChromeService(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=chrome_options)
-        driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-        print("webdriver setup complete.")
-    except WebDriverException as e_wd:
-        print(f"webdriverexception setting up webdriver: {e_wd}")
-        print("this might be due to chromedriver issues (version mismatch, permissions) or chrome browser problems.")
-        return
+        resolve_driver_path()  # resolved once here, workers reuse the cached path
     except Exception as e:
         print(f"error setting up webdriver: {e}")
+        run.not_processed(len(urls_to_parse))
         return
 
-    print(f"\n--- starting detail parsing phase for {len(urls_to_parse)} urls (selenium) ---")
-    parsed_count = 0
-    failed_count = 0
-    skipped_count = 0
-
+    url_queue = queue.Queue()
     for i, ad_url in enumerate(urls_to_parse):
-        print(f"parsing ad {i+1}/{len(urls_to_parse)}: {ad_url}")
-        extracted_data = None
-        try:
-            time.sleep(random.uniform(1.5, 4.0))
-            
-            driver.get(ad_url)
+        url_queue.put((i, ad_url))
 
-            if wait_selector:
-                WebDriverWait(driver, wait_timeout).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, wait_selector))
-                )
-            else:
-                time.sleep(random.uniform(1.0, 2.0))
-
-            time.sleep(random.uniform(0.4, 1.0))
-
-            ad_page_source = driver.page_source
-
-            extracted_data = parse_html_details(ad_page_source, ad_url, config)
+    stop_event = threading.Event()
 
-            is_essential_data_present = all(extracted_data.get(field) for field in essential_fields)
+    print(f"\n--- starting detail parsing phase for {len(urls_to_parse)} urls (selenium, {workers} worker(s), {run.parser.processes} parse process(es)) ---")
+    threads = [
+        threading.Thread(
+            target=_parser_worker,
+            name=f"parser-{n + 1}",
+            args=(url_queue, len(urls_to_parse), config, run, driver_options, rate_limiter, stop_event),
+            daemon=True,
+        )
+        for n in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
 
-            if extracted_data and is_essential_data_present:
-                save_to_csv(extracted_data, data_path, columns)
-                parsed_count += 1
-                print(f"  success: saved data for {ad_url}")
-            elif not is_essential_data_present:
-                print(f"  skipping save: essential data missing ({', '.join(essential_fields)}) for {ad_url}")
-                print(f"  extracted: { {k: v for k, v in extracted_data.items() if k in essential_fields} }")
-                skipped_count += 1
-            else:
-                print(f"  skipping save: parsing function failed significantly for {ad_url}")
-                failed_count += 1
-
-        except TimeoutException:
-            print(f"  timeout waiting for element '{wait_selector}' on ad page: {ad_url}")
-            failed_count += 1
-        except WebDriverException as e_wd:
-            print(f"  webdriverexception during processing {ad_url}: {e_wd}")
-            failed_count += 1
-        except Exception as e:
-            print(f"  error processing ad {ad_url}: {type(e).__name__} - {e}")
-            traceback.print_exc()
-            failed_count += 1
-
-    if driver:
-        print("\nclosing webdriver.")
-        driver.quit()
-        
-    print("\n--- scraping process finished ---")
-    print(f"successfully parsed and saved: {parsed_count}")
-    print(f"skipped (missing essential data): {skipped_count}")
-    print(f"failed (errors or timeouts): {failed_count}")
-    print(f"data saved to: {data_path}")
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(timeout=0.5)
+    except KeyboardInterrupt:
+        print("\nstopping workers, waiting for in-flight ads to finish...")
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+        raise
+    finally:
+        run.not_processed(url_queue.qsize())
+        print(f"selenium rate limiter: {rate_limiter.snapshot()}")
 
 if __name__ == "__main__":
     ACTIVE_CONFIG = KOLESA_ALMATY_CONFIG
     run_update_mode = True # true for update mode, false for full scrape
+    run_revisit_mode = True  # also re-fetch parsed ads that are due (update mode only), see config['revisit']
     # set to None for no limit, or specify a number for maximum ads to scrape
     max_ads_to_scrape = None
 
@@ -341,13 +674,15 @@ if __name__ == "__main__":
     print(f"mode: parsing details from existing url file.")
     if run_update_mode: print("update filtering is on.")
     else: print("update filtering is off (will re-parse all urls in file).")
+    if run_update_mode and run_revisit_mode: print("revisits of parsed ads are on.")
     if max_ads_to_scrape: print(f"maximum ads to scrape limit: {max_ads_to_scrape}")
 
     try:
         run_selenium_parser_from_file(
             config=ACTIVE_CONFIG,
             max_ads=max_ads_to_scrape,
-            update=run_update_mode
+            update=run_update_mode,
+            revisit=run_revisit_mode
         )
     except KeyboardInterrupt:
         print("\nscript interrupted by user (ctrl+c).")
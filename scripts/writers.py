@@ -0,0 +1,223 @@
+import os
+import csv
+import time
+import uuid
+import threading
+from datetime import datetime
+
+# buffered output sinks for parsed rows
+
+class CsvSink:
+    # keeps one append handle open for the whole run, writes the header only into an empty file
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'a', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        if self._file.tell() == 0:
+            print(f"creating/resetting csv with header: {path}")
+            self._writer.writerow(columns)
+            self._sync()
+
+    def write_rows(self, rows):
+        self._writer.writerows([['' if row.get(col) is None else row.get(col) for col in self.columns] for row in rows])
+        self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+class ParquetSink:
+    # writes a dataset partitioned by parsed_at date, and optionally city, under the `path` directory
+    # (layout in dataset.py): every flush adds one complete part file per partition it touches
+    # a part file is written under a hidden temporary name and renamed once it is on disk,
+    # so a killed run leaves only readable files behind and every flushed row is in one of them
+    # small parts are merged: every compact_every parts of a partition, and all parts of the run on close,
+    # which leaves one file per partition and run (a kill while merging can leave the merged rows twice)
+    # schema: arrow schema of the rows (dataset.arrow_schema), inferred from the first batch when None
+    def __init__(self, path, columns, schema=None, partition_by_city=False, compact_every=50, row_group_size=65536):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            from dataset import partition_dir, PARTITION_CITY
+        except ImportError as e:
+            raise ImportError("parquet output needs pyarrow (pip install pyarrow)") from e
+        self._pa = pa
+        self._pq = pq
+        self._partition_dir = partition_dir
+        self.path = path
+        self.partition_by_city = partition_by_city
+        self.compact_every = compact_every
+        self.row_group_size = row_group_size
+        # a partition column is stored in the directory name only
+        self.columns = [col for col in columns if not (partition_by_city and col == PARTITION_CITY)]
+        self.schema = None if schema is None else pa.schema([f for f in schema if f.name in self.columns])
+        os.makedirs(path, exist_ok=True)
+        self.part_prefix = f"part-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self._flushes = 0
+        self._merges = 0
+        self._parts = {}  # partition -> part files of one flush, not merged yet
+        self._merged = {}  # partition -> merged part files
+
+    def write_rows(self, rows):
+        pa = self._pa
+        partitions = {}
+        for row in rows:
+            key = self._partition_dir(row.get('parsed_at'), row.get('city'), self.partition_by_city)
+            partitions.setdefault(key, []).append(row)
+
+        part_name = f"{self.part_prefix}-{self._flushes:05d}.parquet"
+        for key, partition_rows in partitions.items():
+            table = pa.table({col: [row.get(col) for row in partition_rows] for col in self.columns})
+            if self.schema is None:
+                # first batch decides the schema, all-null columns are stored as strings
+                self.schema = pa.schema([
+                    pa.field(f.name, pa.string() if pa.types.is_null(f.type) else f.type) for f in table.schema
+                ])
+            parts = self._parts.setdefault(key, [])
+            parts.append(self._write_part(key, part_name, table.cast(self.schema)))
+            if self.compact_every and len(parts) >= self.compact_every:
+                self._merged.setdefault(key, []).append(self._merge(key, self._parts.pop(key)))
+        self._flushes += 1
+
+    def _write_part(self, key, name, tables):
+        # tables: one table, or an iterable of tables written one after another (one row group or more each)
+        directory = os.path.join(self.path, key)
+        os.makedirs(directory, exist_ok=True)
+        # names starting with '.' are skipped by dataset readers
+        temp_path = os.path.join(directory, f".{name}.tmp")
+        with open(temp_path, 'wb') as part_file:
+            with self._pq.ParquetWriter(part_file, self.schema) as writer:
+                for table in [tables] if isinstance(tables, self._pa.Table) else tables:
+                    writer.write_table(table, row_group_size=self.row_group_size)
+            part_file.flush()
+            os.fsync(part_file.fileno())
+        part_path = os.path.join(directory, name)
+        os.replace(temp_path, part_path)
+        return part_path
+
+    def _merge(self, key, part_paths):
+        # one part file with the rows of part_paths, which are removed once it is on disk
+        merged_path = self._write_part(key, f"{self.part_prefix}-m{self._merges:04d}.parquet", self._row_groups(part_paths))
+        self._merges += 1
+        for part_path in part_paths:
+            os.remove(part_path)
+        return merged_path
+
+    def _row_groups(self, part_paths):
+        # rows of part_paths in tables of about row_group_size rows, so the merged file has few large row groups
+        pending, rows = [], 0
+        for part_path in part_paths:
+            table = self._pq.read_table(part_path, schema=self.schema)
+            pending.append(table)
+            rows += table.num_rows
+            if rows >= self.row_group_size:
+                yield self._pa.concat_tables(pending).combine_chunks()
+                pending, rows = [], 0
+        if pending:
+            yield self._pa.concat_tables(pending).combine_chunks()
+
+    def close(self):
+        for key in set(self._parts) | set(self._merged):
+            part_paths = self._merged.pop(key, []) + self._parts.pop(key, [])
+            if len(part_paths) > 1:
+                self._merge(key, part_paths)
+
+SINKS = {
+    'csv': CsvSink,
+    'parquet': ParquetSink,
+}
+
+class BufferedWriter:
+    # collects rows in memory and hands them to the sink in batches,
+    # a batch is flushed when it reaches batch_size rows or is older than flush_interval seconds,
+    # a background thread enforces the time limit while no rows arrive (rate limiter backoffs, stalled fetches)
+    # safe to share between threads; use as a context manager so ctrl+c still flushes
+    # on_flush(rows) is called after each batch is on disk, e.g. to mark urls as done
+    def __init__(self, sink, batch_size=100, flush_interval=30.0, on_flush=None):
+        self.sink = sink
+        self.on_flush = on_flush
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._timer = None
+        if flush_interval:
+            self._timer = threading.Thread(target=self._flush_periodically, name='writer-flush', daemon=True)
+            self._timer.start()
+
+    def write(self, row):
+        with self._lock:
+            self._buffer.append(row)
+            if len(self._buffer) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._buffer:
+            try:
+                self.sink.write_rows(self._buffer)
+                self.rows_written += len(self._buffer)
+            except Exception as e:
+                print(f"error saving {len(self._buffer)} rows to {self.sink.path}: {e}")
+                raise
+            rows, self._buffer = self._buffer, []
+            if self.on_flush:
+                self.on_flush(rows)
+        self._last_flush = time.monotonic()
+
+    def _flush_periodically(self):
+        while True:
+            with self._lock:
+                due_in = self._last_flush + self.flush_interval - time.monotonic()
+                if due_in <= 0:
+                    try:
+                        self._flush_locked()
+                    except Exception:
+                        return  # the rows stay buffered, the next write or close raises the error
+                    due_in = self.flush_interval
+            if self._closed.wait(due_in):
+                return
+
+    def close(self):
+        self._closed.set()
+        if self._timer is not None:
+            self._timer.join()
+        with self._lock:
+            try:
+                self._flush_locked()
+            finally:
+                self.sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+def open_writer(path, columns, output_format='csv', batch_size=100, flush_interval=30.0, on_flush=None, **sink_options):
+    # creates a buffered writer for `path` using the sink registered for output_format
+    if output_format not in SINKS:
+        raise ValueError(f"unknown output format '{output_format}', expected one of: {', '.join(SINKS)}")
+    sink = SINKS[output_format](path, columns, **sink_options)
+    return BufferedWriter(sink, batch_size=batch_size, flush_interval=flush_interval, on_flush=on_flush)
+
+def sink_options(config, output_format):
+    # sink settings that come from the scraper config (typed schema and partitioning for parquet)
+    if output_format != 'parquet':
+        return {}
+    from dataset import arrow_schema
+    return {'schema': arrow_schema(config), 'partition_by_city': config.get('partition_by_city', False)}